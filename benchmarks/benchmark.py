@@ -0,0 +1,182 @@
+##############################################################################################################
+#
+# Copyright (c) 2023 Sebastian Obele  /  obele.eu
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+##############################################################################################################
+
+
+##############################################################################################################
+# Include
+
+
+#### System ####
+import sys
+import os
+import time
+import json
+import argparse
+import tempfile
+import shutil
+import subprocess
+
+#### Polib ####
+# Installation: pip install polib
+import polib
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+from potranslator import main as potranslator
+
+
+##############################################################################################################
+# Benchmark
+
+
+#### Peak RSS ####
+def peak_rss():
+    try:
+        import resource
+    except ImportError:
+        return None
+    value = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return value // 1024
+    return value
+
+
+#### Create .po file ####
+def create_po(file, size, unique=0.8):
+    # Synthetic catalog, a part of the strings is repeated to simulate typical duplicates.
+    po = polib.POFile()
+    po.metadata = {"Content-Type": "text/plain; charset=UTF-8"}
+    count_unique = max(int(size * unique), 1)
+    for i in range(size):
+        po.append(polib.POEntry(
+            msgid="Benchmark string number " + str(i % count_unique) + ": the quick brown fox jumps over the lazy dog.",
+            msgctxt="ctx" + str(i) if i >= count_unique else None,
+            msgstr="",
+        ))
+    os.makedirs(os.path.dirname(file), exist_ok=True)
+    po.save(file)
+
+
+#### Startup ####
+def startup(repeat):
+    # Wall time of a new process (median), the interpreter alone is the baseline for the import and the command line.
+    env = dict(os.environ)
+    env["PYTHONPATH"] = ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    result = {}
+    for name, args in [("python", ["-c", "pass"]), ("import", ["-c", "import potranslator.main"]), ("help", ["-m", "potranslator.main", "-h"])]:
+        values = []
+        for i in range(repeat):
+            start = time.perf_counter()
+            subprocess.run([sys.executable] + args, stdout=subprocess.DEVNULL, env=env, check=True)
+            values.append(time.perf_counter() - start)
+        result[name] = round(sorted(values)[len(values) // 2], 3)
+    return result
+
+
+#### Run ####
+def run(size, params):
+    path = tempfile.mkdtemp(prefix="potranslator-benchmark-")
+    try:
+        create_po(path+"/locales/en/LC_MESSAGES/base.po", size)
+
+        potranslator.PATH = path+"/config"
+
+        translator_key = "latency="+str(params.latency)+",error="+str(params.error)+",throttle="+str(params.throttle)
+
+        result = {"size": size}
+        for run_name in ["cold", "warm"] if params.cache else ["cold"]:
+            start = time.perf_counter()
+            potranslator.setup(path=path+"/locales", lng_src="en", lng_dst=params.lng_dst, translator="mock", translator_key=translator_key, cache=params.cache, cache_backend=params.cache_backend, force=True, autosave=params.autosave, loglevel=potranslator.LOG_ERROR, workers=params.workers, processes=params.processes, batch_size=params.batch_size)
+            duration = time.perf_counter() - start
+            phases = potranslator.metrics_summary()["phases"]
+            result[run_name] = {
+                "time": round(duration, 3),
+                "entries_per_sec": round(size * len(params.lng_dst.split(",")) / duration, 1),
+                "cache_load": round(phases.get("cache_load", 0.0), 3),
+                "cache_save": round(phases.get("cache_save", 0.0), 3),
+                "po_save": round(phases.get("po_save", 0.0), 3),
+            }
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+    result["peak_rss_kb"] = peak_rss()
+    return result
+
+
+##############################################################################################################
+# Start
+
+
+#### Start ####
+def main():
+    parser = argparse.ArgumentParser(description="PoTranslator benchmark (mock translator, no network access)")
+    parser.add_argument("--sizes", action="store", type=str, default="1000,10000,100000", help="Number of entries of the synthetic .po files (comma separated)")
+    parser.add_argument("-d", "--lng_dst", action="store", type=str, default="de", help="Destination language(s) (comma separated)")
+    parser.add_argument("--latency", action="store", type=float, default=0, help="Mock latency in milliseconds per request")
+    parser.add_argument("--error", action="store", type=float, default=0, help="Mock error rate (0-1)")
+    parser.add_argument("--throttle", action="store", type=float, default=0, help="Mock limit of requests per second (0 = unlimited)")
+    parser.add_argument("-c", "--cache", action="store_true", default=False, help="Use the cache (a second warm run is measured)")
+    parser.add_argument("-cb", "--cache_backend", action="store", type=str, default="sqlite", help="Cache backend")
+    parser.add_argument("-wo", "--workers", action="store", type=int, default=1, help="Number of parallel translations")
+    parser.add_argument("-pr", "--processes", action="store_true", default=False, help="Use worker processes instead of threads")
+    parser.add_argument("-bs", "--batch_size", action="store", type=int, default=1, help="Number of translations per request")
+    parser.add_argument("-a", "--autosave", action="store", type=int, default=50, help="Automatic saving after x-translations")
+    parser.add_argument("--startup", action="store", type=int, default=5, help="Number of measurements of the startup time (0 = disabled)")
+    parser.add_argument("--json", action="store_true", default=False, help="Output the results as JSON")
+    parser.add_argument("--run", action="store", type=int, default=None, help=argparse.SUPPRESS)
+    params = parser.parse_args()
+
+    if params.run:
+        print(json.dumps(run(params.run, params)))
+        return
+
+    # Every size runs in its own process so that the peak RSS values are independent.
+    results = []
+    for size in [int(value) for value in params.sizes.split(",")]:
+        args = [sys.executable, os.path.abspath(__file__), "--run", str(size)] + [arg for arg in sys.argv[1:] if arg != "--json"]
+        output = subprocess.run(args, stdout=subprocess.PIPE, check=True).stdout.decode("utf-8")
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    result_startup = startup(params.startup) if params.startup > 0 else None
+
+    if params.json:
+        print(json.dumps({"startup": result_startup, "sizes": results}, indent=2))
+        return
+
+    if result_startup:
+        print("Startup [s]: python {}, import {}, -h {}".format(result_startup["python"], result_startup["import"], result_startup["help"]))
+
+    print("{:>8} {:>6} {:>9} {:>12} {:>11} {:>11} {:>9} {:>12}".format("Entries", "Run", "Time [s]", "Entries/s", "Cache load", "Cache save", "PO save", "Peak RSS kB"))
+    for result in results:
+        for run_name in ["cold", "warm"]:
+            if run_name in result:
+                item = result[run_name]
+                print("{:>8} {:>6} {:>9} {:>12} {:>11} {:>11} {:>9} {:>12}".format(result["size"], run_name, item["time"], item["entries_per_sec"], item["cache_load"], item["cache_save"], item["po_save"], str(result["peak_rss_kb"])))
+
+
+##############################################################################################################
+# Init
+
+
+if __name__ == "__main__":
+    main()
@@ -31,9 +31,25 @@
 import sys
 import os
 import time
+TIME_START = time.perf_counter()
 import argparse
 import shutil
+import collections
+import threading
+import sqlite3
+import hashlib
+import zlib
+import multiprocessing
+import random
+import json
+import contextlib
+import re
+import queue
+import atexit
+import signal
+import stat
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
 #### Polib ####
 # Installation: pip install polib
@@ -50,15 +66,22 @@ import polib
 
 #### Translators ####
 # Installation: pip install translators
-import translators as ts
+
+# The translation provider modules are imported in setup_translate() only when they are used.
 
 if sys.platform.startswith("win"):
+    import msvcrt
+    fcntl = None
+
     import vendor.umsgpack as umsgpack
 
     #### Version ####
     from _version import __version__, __version_variant__, __copyright_short__, __title__, __description__, __package_name__, __config__
 
 else:
+    import fcntl
+    msvcrt = None
+
     from .vendor import umsgpack as umsgpack
 
     #### Version ####
@@ -69,8 +92,23 @@ else:
 # Globals
 
 
+TIME_IMPORT = time.perf_counter() - TIME_START
+
 PATH = os.path.expanduser("~")+"/.config/"+__package_name__
 TRANSLATOR = None
+TRANSLATOR_SETUP = set()
+
+# Translators which run on the local CPU (no rate limits, parallel by default)
+TRANSLATORS_LOCAL = ["argostranslate"]
+
+# Maximum number of texts and characters per request
+TRANSLATE_BATCH_LIMITS = {
+    None: [1, None],
+    "argostranslate": [None, None],
+    "deepl-api": [50, 30000],
+    "googletrans": [100, 5000],
+    "mock": [50, 30000],
+}
 
 
 ##############################################################################################################
@@ -79,7 +117,7 @@ TRANSLATOR = None
 
 def translate(text, lng_src, lng_dst, translator):
     if translator == "argostranslate":
-        return argostranslate.translate.translate(text, lng_src, lng_dst)
+        return TRANSLATOR[(lng_src, lng_dst)].translate(text)
 
     elif translator == "deepl-api":
         result = TRANSLATOR.translate_text(text, target_lang=lng_dst)
@@ -89,8 +127,1399 @@ def translate(text, lng_src, lng_dst, translator):
         result = TRANSLATOR.translate(text, src=lng_src, dest=lng_dst)
         return result.text
 
+    elif translator == "mock":
+        return translate_mock([text], lng_src, lng_dst)[0]
+
+    else:
+        return TRANSLATOR.translate_text(query_text=text, translator=translator, from_language=lng_src, to_language=lng_dst)
+
+
+def translate_batch(texts, lng_src, lng_dst, translator):
+    if translator == "deepl-api":
+        result = TRANSLATOR.translate_text(texts, target_lang=lng_dst)
+        return [item.text for item in result]
+
+    elif translator == "googletrans":
+        result = TRANSLATOR.translate(texts, src=lng_src, dest=lng_dst)
+        return [item.text for item in result]
+
+    elif translator == "mock":
+        return translate_mock(texts, lng_src, lng_dst)
+
+    else:
+        return [translate(text, lng_src, lng_dst, translator) for text in texts]
+
+
+class MockError(Exception):
+    def __init__(self, text, http_status_code=None):
+        super().__init__(text)
+        self.http_status_code = http_status_code
+
+
+def translate_mock(texts, lng_src, lng_dst):
+    # Deterministic local translator for tests and benchmarks (configured with --translator_key).
+    config = TRANSLATOR
+    if config["throttle"]:
+        with config["lock"]:
+            now = time.monotonic()
+            while config["requests"] and config["requests"][0] < now - 1.0:
+                config["requests"].popleft()
+            if len(config["requests"]) >= config["throttle"]:
+                raise MockError("429 Too Many Requests", 429)
+            config["requests"].append(now)
+    if config["latency"]:
+        time.sleep(config["latency"]/1000.0)
+    result = []
+    for text in texts:
+        if config["error"] and zlib.crc32(text.encode("utf-8")) % 10000 < config["error"] * 10000:
+            raise MockError("Mock error for '"+text+"'", 400)
+        if config["mangle"] and random.random() < config["mangle"]:
+            text = text.replace("[[", "[")
+        result.append("["+lng_dst+"]"+text)
+    return result
+
+
+def translate_batch_limits(translator, batch_size=1):
+    count, chars = TRANSLATE_BATCH_LIMITS.get(translator, TRANSLATE_BATCH_LIMITS[None])
+    if count is None or batch_size < count:
+        count = max(batch_size, 1)
+    return count, chars
+
+
+def translate_batch_job(batch, lng_src, lng_dst, translator, limiter=None, retries=0, mask_retries=None):
+    if mask_retries is None:
+        mask_retries = MASK_RETRIES
+    attempt = 0
+    while True:
+        try:
+            if limiter:
+                time_acquire = rate_limit_acquire(limiter)
+            time_request = time.perf_counter()
+            texts = translate_batch([job["text_src_replaced"] for job in batch], lng_src, lng_dst, translator)
+            metrics_latency(translator, time.perf_counter() - time_request)
+            if len(texts) != len(batch):
+                raise ValueError("Invalid number of translations ("+str(len(texts))+"/"+str(len(batch))+")")
+            for job, text in zip(batch, texts):
+                job["text_dst"] = text
+            if limiter:
+                rate_limit_success(limiter)
+        except Exception as e:
+            transient = translate_error_transient(e)
+            if transient and limiter:
+                rate_limit_error(limiter, time_acquire)
+            if transient and attempt < retries:
+                # A retry is one request, also for a batch (counted on its first job, the same as in the metrics).
+                metrics_retry()
+                batch[0]["retries"] = batch[0].get("retries", 0) + 1
+                delay = min(RETRY_DELAY_MAX, RETRY_DELAY * 2**attempt) * random.uniform(0.5, 1.5)
+                attempt += 1
+                log("Retry "+str(attempt)+"/"+str(retries)+" in "+str(round(delay, 1))+"s: "+str(e), LOG_WARNING)
+                time.sleep(delay)
+                continue
+            if len(batch) == 1 or transient:
+                # Out of retries: the provider is not available, splitting the batch would only repeat the retries per entry
+                for job in batch:
+                    job["error"] = e
+            else:
+                # An invalid entry fails the whole batch, the others are translated separately
+                for job in batch:
+                    translate_batch_job([job], lng_src, lng_dst, translator, limiter, retries, mask_retries)
+            return batch
+
+        # Only the entries with lost/mangled placeholders are translated again.
+        for job in batch:
+            if "error" in job or mask_valid(job["text_src_replaced"], job["text_dst"]):
+                continue
+            if mask_retries > 0:
+                metrics_retry()
+                job["retries"] = job.get("retries", 0) + 1
+                log("Retry (placeholder mismatch): "+job["text_src_replaced"]+" -> "+job["text_dst"], LOG_VERBOSE)
+                translate_batch_job([job], lng_src, lng_dst, translator, limiter, retries, mask_retries - 1)
+            else:
+                job["error"] = ValueError("Placeholder mismatch: "+job["text_src_replaced"]+" -> "+job["text_dst"])
+        return batch
+
+
+def translate_punctuation(text_src, text_dst):
+    # The punctuation at the beginning/end of the translation is set to the one of the source text.
+    if text_src.startswith(('.', ',', ':', ';', '-', '_', '?', '!')):
+        text_src_char0 = text_src[0]
+    else:
+        text_src_char0 = None
+    if text_src.endswith(('.', ',', ':', ';', '-', '_', '?', '!')):
+        text_src_char1 = text_src[-1]
+    else:
+        text_src_char1 = None
+    if text_dst.startswith(('.', ',', ':', ';', '-', '_', '?', '!')):
+        text_dst_char0 = text_dst[0]
+    else:
+        text_dst_char0 = None
+    if text_dst.endswith(('.', ',', ':', ';', '-', '_', '?', '!')):
+        text_dst_char1 = text_dst[-1]
+    else:
+        text_dst_char1 = None
+
+    if text_src_char0 != text_dst_char0:
+        if text_dst_char0 == None:
+            text_dst = text_src_char0 + text_dst
+        elif text_src_char0 == None:
+            text_dst = text_dst[1:]
+        else:
+            text_dst = text_src_char0 + text_dst[1:]
+
+    if text_src_char1 != text_dst_char1:
+        if text_dst_char1 == None:
+            text_dst = text_dst + text_src_char1
+        elif text_src_char1 == None:
+            text_dst = text_dst[:-1]
+        else:
+            text_dst = text_dst[:-1] + text_src_char1
+    return text_dst
+
+
+def translate_error_transient(e):
+    status = getattr(e, "http_status_code", None)
+    if status is None and getattr(e, "response", None) is not None:
+        status = getattr(e.response, "status_code", None)
+    if status is None:
+        status = getattr(e, "status_code", None)
+    if isinstance(status, int):
+        return status == 429 or status >= 500
+    if isinstance(e, (ConnectionError, TimeoutError)):
+        return True
+    name = type(e).__name__
+    return "TooManyRequests" in name or "Timeout" in name or "Connect" in name
+
+
+def translate_pending(job):
+    # Cached entries and duplicates of other entries are not sent to the translator
+    return not job["cached"] and "duplicate" not in job
+
+
+def translate_requests(texts, translator, batch_size=1):
+    batch_count, batch_chars = translate_batch_limits(translator, batch_size)
+    requests = 0
+    count = 0
+    chars = 0
+    for text in texts:
+        if count and ((batch_chars and chars + len(text) > batch_chars) or count >= batch_count):
+            requests += 1
+            count = 0
+            chars = 0
+        count += 1
+        chars += len(text)
+    if count:
+        requests += 1
+    return requests
+
+
+def translate_process_init(translator, translator_key, lng_src, lng_dst, loglevel):
+    global LOG_LEVEL
+    log_reset()
+    LOG_LEVEL = loglevel
+    TRANSLATOR_SETUP.clear()
+    for lng in lng_dst:
+        setup_translate(lng_src=lng_src, lng_dst=lng, translator=translator, translator_key=translator_key)
+
+
+def translate_process_job(texts, lng_src, lng_dst, translator, retries=0):
+    # Runs in a worker process, the results are merged into the jobs and the metrics by the main process.
+    batch = [{"text_src_replaced": text} for text in texts]
+    metrics_reset()
+    translate_batch_job(batch, lng_src, lng_dst, translator, retries=retries)
+    results = [(job.get("text_dst", ""), Exception(str(job["error"])) if "error" in job else None, job.get("retries", 0)) for job in batch]
+    return results, METRICS["latency"].get(translator, []), METRICS["retries"]
+
+
+def translate_shared():
+    # Texts of one target language which were sent by the tasks (files) of a run, other tasks use their translation.
+    return {"lock": threading.Lock(), "jobs": {}}
+
+
+def translate_shared_register(shared, batch, done=False):
+    # Only submitted jobs are registered: their translation finishes without the consumer of the task, so waiting for them cannot block.
+    with shared["lock"]:
+        for job in batch:
+            job["event"] = threading.Event()
+            shared["jobs"].setdefault(job["text_src_replaced"], job)
+            if done:
+                translate_shared_done(shared, job)
+
+
+def translate_shared_done(shared, job):
+    # Only the result is kept, not the job with the entry of its file.
+    if shared["jobs"].get(job["text_src_replaced"]) is job:
+        result = {"text_dst": job.get("text_dst", ""), "event": job["event"]}
+        if "error" in job:
+            result["error"] = job["error"]
+        shared["jobs"][job["text_src_replaced"]] = result
+    job["event"].set()
+
+
+def translate_shared_lookup(shared, group):
+    with shared["lock"]:
+        for job in group:
+            if translate_pending(job):
+                other = shared["jobs"].get(job["text_src_replaced"])
+                if other is not None:
+                    job["duplicate"] = other
+
+
+def translate_jobs(jobs, lng_src, lng_dst, translator, workers=1, batch_size=1, limiter=None, retries=0, pool=None, shared=None):
+    # The jobs are returned in the original order, independent of the order in which they were finished.
+    batch_count, batch_chars = translate_batch_limits(translator, batch_size)
+    if pool:
+        executor = pool
+    elif workers > 1:
+        executor = ThreadPoolExecutor(max_workers=workers)
+    else:
+        executor = None
+    pending_jobs = collections.deque()
+    batches = collections.deque()
+    batch = []
+    chars = 0
+
+    def run(batch):
+        try:
+            return translate_batch_job(batch, lng_src, lng_dst, translator, limiter, retries)
+        finally:
+            if shared is not None:
+                with shared["lock"]:
+                    for job in batch:
+                        translate_shared_done(shared, job)
+
+    def submit():
+        nonlocal batch, chars
+        item = {"jobs": batch, "future": None}
+        for job in batch:
+            job["batch"] = item
+        if pool:
+            # The results of worker processes are only available in finish(), they are registered there.
+            item["future"] = pool.submit(translate_process_job, [job["text_src_replaced"] for job in batch], lng_src, lng_dst, translator, retries)
+            batches.append(item)
+        else:
+            if shared is not None:
+                translate_shared_register(shared, batch)
+            if executor:
+                item["future"] = executor.submit(run, batch)
+                batches.append(item)
+            else:
+                run(batch)
+        batch = []
+        chars = 0
+
+    def ready(job):
+        if not translate_pending(job):
+            return True
+        if "batch" not in job:
+            return False
+        return job["batch"]["future"] is None or job["batch"]["future"].done()
+
+    def finish(job):
+        item = job.pop("batch", None)
+        if item is None and translate_pending(job):
+            submit()
+            item = job.pop("batch")
+        if item and item["future"]:
+            try:
+                result = item["future"].result()
+            except Exception as e:
+                result = ([("", e, 0)] * len(item["jobs"]), [], 0)
+            if pool:
+                result, latencies, retries_request = result
+                for seconds in latencies:
+                    metrics_latency(translator, seconds)
+                metrics_retry(retries_request)
+                for job_item, (text_dst, error, retries_job) in zip(item["jobs"], result):
+                    job_item["text_dst"] = text_dst
+                    if error is not None:
+                        job_item["error"] = error
+                    if retries_job:
+                        job_item["retries"] = retries_job
+                if shared is not None:
+                    translate_shared_register(shared, item["jobs"], done=True)
+            item["future"] = None
+            batches.remove(item)
+        if "duplicate" in job and "event" in job["duplicate"]:
+            # Text of another task which is still being translated
+            job["duplicate"]["event"].wait()
+        return job
+
+    try:
+        for job in jobs:
+            if shared is not None and job is job.get("group", [job])[0]:
+                translate_shared_lookup(shared, job.get("group", [job]))
+            if translate_pending(job):
+                # A group (plural variants) is never split over two requests.
+                group = [item for item in job.get("group", [job]) if translate_pending(item)]
+                if batch and job is group[0]:
+                    group_chars = sum([len(item["text_src_replaced"]) for item in group])
+                    if len(batch) + len(group) > batch_count or (batch_chars and chars + group_chars > batch_chars):
+                        submit()
+                batch.append(job)
+                chars += len(job["text_src_replaced"])
+                if len(batch) >= batch_count and job is group[-1]:
+                    submit()
+            pending_jobs.append(job)
+            while pending_jobs and (len(batches) >= workers*2 or ready(pending_jobs[0])):
+                yield finish(pending_jobs.popleft())
+        while pending_jobs:
+            yield finish(pending_jobs.popleft())
+    finally:
+        if executor and not pool:
+            executor.shutdown(wait=True)
+
+
+def translate_texts(texts, lng_src, lng_dst, translator, cache=None, cache_read=False, cache_write=False, replace_src=None, replace_dst=None, mask=True, workers=1, batch_size=1, limiter=None, retries=0):
+    # Single strings (server/stream mode) with the same steps as the entries of a .po file: cache, duplicates, masking, replacements and punctuation.
+    # Yields (text_dst, error) in the order of the texts.
+    jobs = []
+    pending = {}
+    for text in texts:
+        text_replaced = replace_apply(replace_src, text)
+        job = {"text_src": text, "text_src_replaced": text_replaced, "cache_key": text_replaced, "text_dst": "", "cached": text == ""}
+
+        if cache_read and not job["cached"]:
+            text_dst = cache_get(cache, translator, lng_src+"_"+lng_dst, text_replaced)
+            if text_dst is not None:
+                job["text_dst"] = text_dst
+                job["cached"] = True
+
+        if not job["cached"]:
+            if mask:
+                job["text_src_replaced"], job["mask"] = mask_text(text_replaced)
+                text_replaced = job["text_src_replaced"]
+            if text_replaced in pending:
+                job["duplicate"] = pending[text_replaced]
+            else:
+                pending[text_replaced] = job
+
+        jobs.append(job)
+
+    for job in translate_jobs(jobs, lng_src, lng_dst, translator, workers=workers, batch_size=batch_size, limiter=limiter, retries=retries):
+        if "duplicate" in job:
+            if "error" in job["duplicate"]:
+                job["error"] = job["duplicate"]["error"]
+            job["text_dst"] = job["duplicate"]["text_dst"]
+        if "error" in job:
+            yield "", job["error"]
+            continue
+
+        text_dst = job["text_dst"]
+        if text_dst != "":
+            if "mask" in job:
+                text_dst = mask_restore(text_dst, job["mask"])
+            if not job["cached"] and "duplicate" not in job and cache_write:
+                cache_set(cache, translator, lng_src+"_"+lng_dst, job["cache_key"], text_dst)
+            text_dst = replace_apply(replace_dst, text_dst)
+            text_dst = translate_punctuation(job["text_src"], text_dst)
+        yield text_dst, None
+
+
+##############################################################################################################
+# Rate limit
+
+
+# Adaptive token bucket (AIMD): The rate is halved on throttling/server errors and increased again on success.
+# Errors of requests which were started before the last decrease (or shortly after it, while the provider still counts
+# the previous requests) belong to the same throttling event and are ignored.
+RATE_LIMIT_MIN     = 0.1
+RATE_LIMIT_MAX     = 100.0
+RATE_LIMIT_BURST   = 1.0
+RATE_LIMIT_STEP    = 0.2
+RATE_LIMIT_GROWTH  = 0.1
+RATE_LIMIT_HOLD    = 1.0
+RATE_LIMIT_RECOVER = 0.75  # Part of the throttled rate which is reached again quickly (multiplicative increase)
+
+RETRY_DELAY      = 1.0
+RETRY_DELAY_MAX  = 60.0
+
+
+def rate_limiter(wait=0):
+    return {
+        "lock": threading.Lock(),
+        "rate": 1000.0/wait if wait else None,
+        "rate_last": None,
+        "tokens": RATE_LIMIT_BURST,
+        "time": time.monotonic(),
+        "time_decrease": None,
+        "history": collections.deque(maxlen=int(RATE_LIMIT_MAX)),
+    }
+
+
+def rate_limit_acquire(limiter):
+    # Returns the start time of the request, which is passed to rate_limit_error().
+    with limiter["lock"]:
+        now = time.monotonic()
+        limiter["history"].append(now)
+        rate = limiter["rate"]
+        if rate is None:
+            return now
+        limiter["tokens"] = min(RATE_LIMIT_BURST, limiter["tokens"] + (now - limiter["time"]) * rate)
+        limiter["time"] = now
+        limiter["tokens"] -= 1.0
+        delay = -limiter["tokens"] / rate if limiter["tokens"] < 0 else 0
+    if delay:
+        time.sleep(delay)
+    return now
+
+
+def rate_limit_success(limiter):
+    with limiter["lock"]:
+        rate = limiter["rate"]
+        if rate is None:
+            return
+        if limiter["rate_last"] and rate < limiter["rate_last"]:
+            # Fast recovery up to a part of the throttled rate, slow increase above it
+            rate = min(limiter["rate_last"], rate * (1.0 + RATE_LIMIT_GROWTH))
+        else:
+            rate += RATE_LIMIT_STEP
+        limiter["rate"] = None if rate >= RATE_LIMIT_MAX else rate
+
+
+def rate_limit_error(limiter, time_request=None):
+    with limiter["lock"]:
+        if limiter["time_decrease"] is not None and time_request is not None and time_request < limiter["time_decrease"] + RATE_LIMIT_HOLD:
+            return
+        rate = limiter["rate"]
+        if rate is None:
+            now = time.monotonic()
+            history = [value for value in limiter["history"] if value > now - 1.0]
+            rate = min(max(len(history), 1.0), RATE_LIMIT_MAX)
+        limiter["rate_last"] = rate * RATE_LIMIT_RECOVER
+        limiter["rate"] = max(RATE_LIMIT_MIN, rate / 2.0)
+        limiter["tokens"] = min(limiter["tokens"], 0.0)
+        limiter["time_decrease"] = time.monotonic()
+
+
+##############################################################################################################
+# Replace
+
+
+def replace_parse(text, rules=None):
+    # "search=replace,search=replace,..."
+    if rules is None:
+        rules = {}
+    if text:
+        for part in text.split(","):
+            if "=" in part:
+                key, value = part.split("=", 1)
+                rules[key] = value
+    return rules
+
+
+def replace_load(file, replace_src, replace_dst):
+    # Glossary file: one "search=replace" rule per line, "#" comments.
+    # The rules apply to source and destination ([both], default) or only to one of them ([src]/[dst]).
+    section = "both"
+    count = 0
+    with open(file, "r", encoding="utf-8") as fh:
+        for line in fh:
+            line = line.rstrip("\r\n")
+            if line.strip() == "" or line.lstrip().startswith("#"):
+                continue
+            if line.strip() in ["[both]", "[src]", "[dst]"]:
+                section = line.strip()[1:-1]
+                continue
+            if "=" not in line:
+                continue
+            key, value = line.split("=", 1)
+            if section == "both":
+                replace_src[key] = value
+                replace_dst[value] = key
+            elif section == "src":
+                replace_src[key] = value
+            else:
+                replace_dst[key] = value
+            count += 1
+    log("Loaded "+str(count)+" glossary rules from '"+file+"'", LOG_INFO)
+
+
+def replace_compile(rules):
+    # The rules behave like consecutive str.replace() calls in the given order.
+    # If no rule can affect the matches of a later rule, one regex pass gives the same result.
+    rules = [(key, value) for key, value in rules.items() if key != ""]
+    compiled = {"rules": rules, "mapping": dict(rules), "regex": None}
+    if rules and not replace_conflict(rules):
+        compiled["regex"] = re.compile("|".join([re.escape(key) for key, value in rules]))
+    return compiled
+
+
+def replace_conflict(rules):
+    for i, (key_i, value_i) in enumerate(rules):
+        for key_j, value_j in rules[i+1:]:
+            # A later search string which would win the leftmost match.
+            if key_j.find(key_i, 1) != -1 or replace_overlap(key_j, key_i):
+                return True
+            # A replacement which creates a match for a later rule.
+            if value_i == "" or key_j in value_i or value_i in key_j or replace_overlap(value_i, key_j) or replace_overlap(key_j, value_i):
+                return True
+    return False
+
+
+def replace_overlap(a, b):
+    # True if a proper suffix of a is a prefix of b.
+    if not a or not b:
+        return False
+    start = a.find(b[0], max(1, len(a) - len(b) + 1))
+    while start != -1:
+        if b.startswith(a[start:]):
+            return True
+        start = a.find(b[0], start + 1)
+    return False
+
+
+def replace_apply(compiled, text):
+    if not compiled or not compiled["rules"]:
+        return text
+    if compiled["regex"]:
+        mapping = compiled["mapping"]
+        return compiled["regex"].sub(lambda match: mapping[match.group(0)], text)
+    for key, value in compiled["rules"]:
+        text = text.replace(key, value)
+    return text
+
+
+def match_compile(values):
+    # Substring match against any of the values.
+    if not values:
+        return None
+    return re.compile("|".join([re.escape(value) for value in values]))
+
+
+##############################################################################################################
+# Mask
+
+
+# Placeholders and markup which are replaced by opaque tokens before the translation.
+MASK_REGEX = re.compile("|".join([
+    r"\[\[\d+\]\]",                                                        # Token (literal in the source)
+    r"%(?:\([^()]+\))?[#0+\-]*(?:\d+|\*)?(?:\.(?:\d+|\*))?[hlLqjzt]*[diouxXeEfFgGcrsa%]",  # printf/Python %-format
+    r"\{[A-Za-z0-9_.\[\]]*(?:![rsa])?(?::[^{}]*)?\}",                          # str.format/ICU
+    r"</?[A-Za-z][^<>]*>",                                                   # HTML/XML tags
+    r"&(?:[A-Za-z]+|#\d+|#x[0-9A-Fa-f]+);",                                 # HTML entities
+]))
+MASK_TOKEN_REGEX = re.compile(r"\[\[\s*(\d+)\s*\]\]")
+MASK_RETRIES = 2
+
+
+def mask_text(text):
+    values = []
+
+    def token(match):
+        values.append(match.group(0))
+        return "[[" + str(len(values) - 1) + "]]"
+
+    text = MASK_REGEX.sub(token, text)
+    return text, values
+
+
+def mask_restore(text, values):
+    def value(match):
+        index = int(match.group(1))
+        return values[index] if index < len(values) else match.group(0)
+
+    return MASK_TOKEN_REGEX.sub(value, text)
+
+
+def mask_valid(text_src, text_dst):
+    # Every token of the source has to be in the translation exactly once.
+    tokens_src = MASK_TOKEN_REGEX.findall(text_src)
+    if not tokens_src:
+        return not MASK_TOKEN_REGEX.search(text_dst)
+    return sorted(tokens_src) == sorted(MASK_TOKEN_REGEX.findall(text_dst))
+
+
+##############################################################################################################
+# Translation memory
+
+
+TM_NGRAM = 3
+TM_POSTING_MAX = 2000  # N-grams which occur in more entries are too common to find candidates
+
+
+def tm_create():
+    # "final": the translation is already in the final form (replace_dst applied, entries of the .po file)
+    return {"src": [], "dst": [], "final": [], "grams": [], "placeholders": [], "index": {}}
+
+
+def tm_ngrams(text):
+    text = " " + " ".join(text.lower().split()) + " "
+    return set([text[i:i+TM_NGRAM] for i in range(len(text) - TM_NGRAM + 1)])
+
+
+def tm_add(tm, text_src, text_dst, final=False):
+    if not text_src or not text_dst:
+        return
+    grams = tm_ngrams(text_src)
+    index = len(tm["src"])
+    tm["src"].append(text_src)
+    tm["dst"].append(text_dst)
+    tm["final"].append(final)
+    tm["grams"].append(len(grams))
+    tm["placeholders"].append(sorted(MASK_REGEX.findall(text_src)))
+    for gram in grams:
+        tm["index"].setdefault(gram, []).append(index)
+
+
+def tm_lookup(tm, text, threshold):
+    # Most similar source text (Dice coefficient of the character n-grams) with the same placeholders.
+    # Returns the translation, the similarity and if the translation is already in the final form.
+    grams = tm_ngrams(text)
+    if not grams:
+        return None, 0.0, False
+    counts = collections.Counter()
+    for gram in grams:
+        indexes = tm["index"].get(gram)
+        if indexes and len(indexes) <= TM_POSTING_MAX:
+            counts.update(indexes)
+    placeholders = None
+    best = None
+    best_score = threshold
+    for index, shared in counts.items():
+        score = 2.0 * shared / (len(grams) + tm["grams"][index])
+        if score < best_score:
+            continue
+        if placeholders is None:
+            placeholders = sorted(MASK_REGEX.findall(text))
+        if tm["placeholders"][index] != placeholders:
+            continue
+        best = index
+        best_score = score
+    if best is None:
+        return None, 0.0, False
+    return tm["dst"][best], best_score, tm["final"][best]
+
+
+##############################################################################################################
+# Cache
+
+
+CACHE_LOCK = threading.Lock()
+CACHE_BACKENDS = ["sqlite", "msgpack"]
+CACHE_TIMEOUT = 60.0
+
+
+def cache_open(backend="sqlite", create=False):
+    if create and not os.path.exists(PATH):
+        os.makedirs(PATH)
+
+    if backend == "sqlite":
+        file = PATH+"/cache.db"
+        exists = os.path.isfile(file)
+        if not exists and not create:
+            # Read only access to a not yet converted cache
+            return cache_open(backend="msgpack")
+        # Several processes can use the database at the same time (WAL), the writes are collected and committed in short transactions by cache_save().
+        db = sqlite3.connect(file, timeout=CACHE_TIMEOUT, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute("CREATE TABLE IF NOT EXISTS cache (translator TEXT NOT NULL, lng TEXT NOT NULL, src TEXT NOT NULL, dst TEXT NOT NULL, time INTEGER NOT NULL, used INTEGER NOT NULL DEFAULT 0, hits INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (translator, lng, src)) WITHOUT ROWID")
+        db.execute("CREATE TABLE IF NOT EXISTS stats (translator TEXT NOT NULL, lng TEXT NOT NULL, lookups INTEGER NOT NULL DEFAULT 0, hits INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (translator, lng))")
+        columns = [row[1] for row in db.execute("PRAGMA table_info(cache)")]
+        for column in ["used", "hits"]:
+            if column not in columns:
+                try:
+                    db.execute("ALTER TABLE cache ADD COLUMN "+column+" INTEGER NOT NULL DEFAULT 0")
+                except sqlite3.OperationalError:
+                    pass  # Added by another process
+        db.commit()
+        cache = {"backend": "sqlite", "file": file, "db": db, "new": {}, "uses": {}, "stats": {}}
+        if not exists and os.path.isfile(PATH+"/cache.data"):
+            try:
+                cache_import(cache, PATH+"/cache.data")
+            except Exception as e:
+                log(str(e), LOG_ERROR)
+        return cache
+
+    elif backend == "msgpack":
+        # One file per translator and language pair, loaded on first access.
+        # The time of creation/last use and the hits are stored in a separate file (<lng>.meta).
+        cache = {"backend": "msgpack", "path": PATH+"/cache", "data": {}, "meta": {}, "dirty": set(), "deleted": {}, "readonly": not create, "new": {}, "uses": {}, "stats": {}}
+        if not os.path.isdir(cache["path"]) and os.path.isfile(PATH+"/cache.data"):
+            try:
+                fh = open(PATH+"/cache.data", "rb")
+                data = umsgpack.unpackb(fh.read())
+                fh.close()
+                for translator, lngs in data.items():
+                    for lng, texts in lngs.items():
+                        cache["data"][(translator, lng)] = texts
+                        cache["dirty"].add((translator, lng))
+            except Exception as e:
+                log(str(e), LOG_ERROR)
+        return cache
+
     else:
-        return ts.translate_text(query_text=text, translator=translator, from_language=lng_src, to_language=lng_dst)
+        raise ValueError("Unknown cache backend '"+backend+"'")
+
+
+def cache_get(cache, translator, lng, text, track=True):
+    with CACHE_LOCK:
+        text_dst = cache["new"].get((translator, lng), {}).get(text)
+        if text_dst is not None:
+            pass
+        elif cache["backend"] == "sqlite":
+            row = cache["db"].execute("SELECT dst FROM cache WHERE translator=? AND lng=? AND src=?", (translator, lng, text)).fetchone()
+            text_dst = row[0] if row else None
+        else:
+            text_dst = cache_bucket(cache, translator, lng).get(text)
+        if not track:
+            return text_dst
+        # Hits and lookups are collected in memory and written with cache_save()
+        stats = cache["stats"].setdefault((translator, lng), [0, 0])
+        stats[0] += 1
+        if text_dst is not None:
+            stats[1] += 1
+            uses = cache["uses"].setdefault((translator, lng), {})
+            uses[text] = uses.get(text, 0) + 1
+        return text_dst
+
+
+def cache_set(cache, translator, lng, text_src, text_dst):
+    # New entries are kept in memory until cache_save(), which merges them with the entries of other processes.
+    with CACHE_LOCK:
+        cache["new"].setdefault((translator, lng), {})[text_src] = text_dst
+
+
+def cache_save(cache):
+    with CACHE_LOCK, metrics_phase("cache_save"):
+        try:
+            now = int(time.time())
+            if cache["backend"] == "sqlite":
+                db = cache["db"]
+                for (translator, lng), texts in cache["new"].items():
+                    db.executemany("INSERT OR REPLACE INTO cache (translator, lng, src, dst, time) VALUES (?, ?, ?, ?, ?)", [(translator, lng, text_src, text_dst, now) for text_src, text_dst in texts.items()])
+                for (translator, lng), uses in cache["uses"].items():
+                    db.executemany("UPDATE cache SET used=?, hits=hits+? WHERE translator=? AND lng=? AND src=?", [(now, count, translator, lng, text) for text, count in uses.items()])
+                for (translator, lng), (lookups, hits) in cache["stats"].items():
+                    db.execute("INSERT OR IGNORE INTO stats (translator, lng) VALUES (?, ?)", (translator, lng))
+                    db.execute("UPDATE stats SET lookups=lookups+?, hits=hits+? WHERE translator=? AND lng=?", (lookups, hits, translator, lng))
+                db.commit()
+            elif not cache["readonly"]:
+                for key in cache["dirty"] | set(cache["new"]) | set(cache["uses"]):
+                    translator, lng = key
+                    file = cache["path"]+"/"+translator+"/"+lng
+                    if not os.path.exists(os.path.dirname(file)):
+                        os.makedirs(os.path.dirname(file))
+                    # Other processes may have written the shard in the meantime: read, merge and write it while holding the lock.
+                    with cache_lock(file):
+                        if key in cache["dirty"]:
+                            data = cache_bucket(cache, translator, lng)
+                            meta = cache_meta(cache, translator, lng)
+                            deleted = cache["deleted"].get(key, set())
+                            for text_src, text_dst in (cache_read_file(file+".data") or {}).items():
+                                if text_src not in data and text_src not in deleted:
+                                    data[text_src] = text_dst
+                        else:
+                            data = cache_read_file(file+".data") or {}
+                            meta = cache_read_file(file+".meta") or {}
+                        for text_src, text_dst in cache["new"].get(key, {}).items():
+                            data[text_src] = text_dst
+                            meta[text_src] = [now, 0, 0]
+                        for text in data:
+                            if text not in meta:
+                                meta[text] = [now, 0, 0]
+                        for text, count in cache["uses"].get(key, {}).items():
+                            if text in meta:
+                                meta[text][1] = now
+                                meta[text][2] += count
+                        if key in cache["dirty"] or key in cache["new"]:
+                            cache_write_file(file+".data", data)
+                        cache_write_file(file+".meta", meta)
+                    cache["data"][key] = data
+                    cache["meta"][key] = meta
+                if cache["stats"]:
+                    with cache_lock(cache["path"]+"/stats"):
+                        stats = cache_read_file(cache["path"]+"/stats.data") or {}
+                        for (translator, lng), (lookups, hits) in cache["stats"].items():
+                            value = stats.setdefault(translator, {}).setdefault(lng, [0, 0])
+                            value[0] += lookups
+                            value[1] += hits
+                        cache_write_file(cache["path"]+"/stats.data", stats)
+                cache["dirty"] = set()
+                cache["deleted"] = {}
+            else:
+                return
+            cache["new"] = {}
+            cache["uses"] = {}
+            cache["stats"] = {}
+        except Exception as e:
+            log(str(e), LOG_ERROR)
+
+
+@contextlib.contextmanager
+def cache_lock(file):
+    # Exclusive lock between processes (lock file next to the cache file).
+    fh = open(file+".lock", "a+b")
+    try:
+        if fcntl:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+        elif msvcrt:
+            fh.seek(0)
+            msvcrt.locking(fh.fileno(), msvcrt.LK_LOCK, 1)
+        yield
+    finally:
+        if fcntl:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+        elif msvcrt:
+            fh.seek(0)
+            msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+        fh.close()
+
+
+def cache_read_file(file):
+    if not os.path.isfile(file):
+        return None
+    fh = open(file, "rb")
+    data = umsgpack.unpackb(fh.read())
+    fh.close()
+    return data
+
+
+def cache_write_file(file, data):
+    fh = open(file+".tmp", "wb")
+    fh.write(umsgpack.packb(data))
+    fh.close()
+    os.replace(file+".tmp", file)
+
+
+def cache_bucket(cache, translator, lng):
+    key = (translator, lng)
+    if key not in cache["data"]:
+        cache["data"][key] = {}
+        try:
+            cache["data"][key] = cache_read_file(cache["path"]+"/"+translator+"/"+lng+".data") or {}
+        except Exception as e:
+            log(str(e), LOG_ERROR)
+    return cache["data"][key]
+
+
+def cache_meta(cache, translator, lng):
+    # text -> [time, used, hits]
+    key = (translator, lng)
+    if key not in cache["meta"]:
+        cache["meta"][key] = {}
+        try:
+            cache["meta"][key] = cache_read_file(cache["path"]+"/"+translator+"/"+lng+".meta") or {}
+        except Exception as e:
+            log(str(e), LOG_ERROR)
+    return cache["meta"][key]
+
+
+def cache_items(cache, translator, lng):
+    with CACHE_LOCK:
+        if cache["backend"] == "sqlite":
+            return cache["db"].execute("SELECT src, dst FROM cache WHERE translator=? AND lng=?", (translator, lng)).fetchall()
+        else:
+            return list(cache_bucket(cache, translator, lng).items())
+
+
+def cache_close(cache):
+    cache_save(cache)
+    if cache["backend"] == "sqlite":
+        cache["db"].close()
+
+
+def cache_import(cache, file):
+    now = int(time.time())
+    count = 0
+    for record in cache_records(file):
+        if not record[4]:
+            record = record[:4] + (now,) + record[5:]
+        cache_put(cache, *record)
+        count += 1
+    cache_save(cache)
+    log("Imported "+str(count)+" cache entries from '"+file+"'", LOG_NOTICE)
+    return count
+
+
+##############################################################################################################
+# Cache maintenance
+
+
+def cache_pairs(cache):
+    # All (translator, lng) pairs of the cache.
+    if cache["backend"] == "sqlite":
+        return [tuple(row) for row in cache["db"].execute("SELECT DISTINCT translator, lng FROM cache ORDER BY translator, lng")]
+    pairs = set(cache["data"].keys())
+    if os.path.isdir(cache["path"]):
+        for translator in os.listdir(cache["path"]):
+            if os.path.isdir(cache["path"]+"/"+translator):
+                for name in os.listdir(cache["path"]+"/"+translator):
+                    if name.endswith(".data"):
+                        pairs.add((translator, name[:-5]))
+    return sorted(pairs)
+
+
+def cache_entries(cache, translator=None, lng=None):
+    # (translator, lng, src, dst, time, used, hits)
+    if cache["backend"] == "sqlite":
+        query = "SELECT translator, lng, src, dst, time, used, hits FROM cache WHERE (? IS NULL OR translator=?) AND (? IS NULL OR lng=?)"
+        for row in cache["db"].execute(query, (translator, translator, lng, lng)).fetchall():
+            yield tuple(row)
+        return
+    for pair_translator, pair_lng in cache_pairs(cache):
+        if (translator and pair_translator != translator) or (lng and pair_lng != lng):
+            continue
+        meta = cache_meta(cache, pair_translator, pair_lng)
+        for text_src, text_dst in cache_bucket(cache, pair_translator, pair_lng).items():
+            value = meta.get(text_src, [0, 0, 0])
+            yield (pair_translator, pair_lng, text_src, text_dst, value[0], value[1], value[2])
+
+
+def cache_put(cache, translator, lng, text_src, text_dst, time_created=0, used=0, hits=0):
+    # Merge an entry: the newer translation wins, the usage is combined.
+    if cache["backend"] == "sqlite":
+        cache["db"].execute("INSERT INTO cache (translator, lng, src, dst, time, used, hits) VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (translator, lng, src) DO UPDATE SET dst=CASE WHEN excluded.time > time THEN excluded.dst ELSE dst END, time=MAX(time, excluded.time), used=MAX(used, excluded.used), hits=hits+excluded.hits", (translator, lng, text_src, text_dst, time_created, used, hits))
+        return
+    data = cache_bucket(cache, translator, lng)
+    meta = cache_meta(cache, translator, lng)
+    value = meta.get(text_src)
+    if text_src not in data or value is None or time_created > value[0]:
+        data[text_src] = text_dst
+    if value is None:
+        meta[text_src] = [time_created, used, hits]
+    else:
+        meta[text_src] = [max(value[0], time_created), max(value[1], used), value[2] + hits]
+    cache["dirty"].add((translator, lng))
+
+
+def cache_delete(cache, translator, lng, text_src):
+    if cache["backend"] == "sqlite":
+        cache["db"].execute("DELETE FROM cache WHERE translator=? AND lng=? AND src=?", (translator, lng, text_src))
+        return
+    cache_bucket(cache, translator, lng).pop(text_src, None)
+    cache_meta(cache, translator, lng).pop(text_src, None)
+    cache["deleted"].setdefault((translator, lng), set()).add(text_src)
+    cache["dirty"].add((translator, lng))
+
+
+def cache_stats(cache):
+    stats = {}
+    for translator, lng, text_src, text_dst, time_created, used, hits in cache_entries(cache):
+        value = stats.setdefault((translator, lng), {"entries": 0, "bytes": 0, "lookups": 0, "hits": 0})
+        value["entries"] += 1
+        value["bytes"] += len(text_src.encode("utf-8")) + len(text_dst.encode("utf-8"))
+    if cache["backend"] == "sqlite":
+        rows = cache["db"].execute("SELECT translator, lng, lookups, hits FROM stats").fetchall()
+    else:
+        data = cache_read_file(cache["path"]+"/stats.data") or {}
+        rows = [(translator, lng, value[0], value[1]) for translator, lngs in data.items() for lng, value in lngs.items()]
+    for translator, lng, lookups, hits in rows:
+        value = stats.setdefault((translator, lng), {"entries": 0, "bytes": 0, "lookups": 0, "hits": 0})
+        value["lookups"] += lookups
+        value["hits"] += hits
+    return stats
+
+
+def cache_prune(cache, age=None, max_entries=None, translator=None, lng=None):
+    # Removes the entries which were not used for `age` days and keeps at most `max_entries` (least recently used first).
+    entries = [(max(record[4], record[5]), record[0], record[1], record[2]) for record in cache_entries(cache, translator, lng)]
+    remove = []
+    if age is not None:
+        limit = time.time() - age * 86400
+        remove = [entry for entry in entries if entry[0] < limit]
+        entries = [entry for entry in entries if entry[0] >= limit]
+    if max_entries is not None and len(entries) > max_entries:
+        entries.sort()
+        remove += entries[:len(entries) - max_entries]
+    for entry in remove:
+        cache_delete(cache, entry[1], entry[2], entry[3])
+    cache_save(cache)
+    if cache["backend"] == "sqlite" and remove:
+        cache["db"].execute("VACUUM")
+    return len(remove)
+
+
+def cache_export(cache, file, format="msgpack", translator=None, lng=None):
+    # Same structure as the old cache.data file, the values contain the translation, time of creation/last use and hits.
+    data = {}
+    count = 0
+    for record in cache_entries(cache, translator, lng):
+        data.setdefault(record[0], {}).setdefault(record[1], {})[record[2]] = list(record[3:])
+        count += 1
+    if format == "json":
+        fh = open(file+".tmp", "w", encoding="utf-8")
+        json.dump(data, fh, ensure_ascii=False, indent=1)
+        fh.close()
+        os.replace(file+".tmp", file)
+    else:
+        cache_write_file(file, data)
+    return count
+
+
+def cache_records(file):
+    # Entries of a cache database, a cache folder (msgpack backend) or an exported/old cache.data file.
+    if os.path.isdir(file):
+        if os.path.isdir(file+"/cache"):
+            file = file+"/cache"
+        cache = {"backend": "msgpack", "path": file, "data": {}, "meta": {}, "dirty": set(), "deleted": {}, "readonly": True, "new": {}, "uses": {}, "stats": {}}
+        yield from cache_entries(cache)
+        return
+    fh = open(file, "rb")
+    header = fh.read(16)
+    fh.close()
+    if header == b"SQLite format 3\x00":
+        db = sqlite3.connect(file)
+        columns = [row[1] for row in db.execute("PRAGMA table_info(cache)")]
+        if "used" in columns:
+            rows = db.execute("SELECT translator, lng, src, dst, time, used, hits FROM cache").fetchall()
+        else:
+            rows = db.execute("SELECT translator, lng, src, dst, time, 0, 0 FROM cache").fetchall()
+        db.close()
+        yield from [tuple(row) for row in rows]
+        return
+    if file.endswith(".json"):
+        fh = open(file, "r", encoding="utf-8")
+        data = json.load(fh)
+        fh.close()
+    else:
+        data = cache_read_file(file)
+    for translator, lngs in data.items():
+        for lng, texts in lngs.items():
+            for text_src, value in texts.items():
+                if isinstance(value, str):
+                    yield (translator, lng, text_src, value, 0, 0, 0)
+                else:
+                    yield (translator, lng, text_src) + tuple(value)
+
+
+##############################################################################################################
+# PO file
+
+
+def po_load(file):
+    with metrics_phase("po_parse"):
+        return polib.pofile(file)
+
+
+def po_save(po, file):
+    # Write to a temporary file first so that an interrupted save never leaves a broken file behind.
+    with metrics_phase("po_save"):
+        po.save(file+".tmp")
+        os.replace(file+".tmp", file)
+
+
+# Plural forms of the target languages, used if the header of the target file is missing or has a different count (copy of the source file).
+PO_PLURAL_FORMS = {
+    "nplurals=1; plural=0;": ["id", "ja", "km", "ko", "lo", "ms", "my", "th", "vi", "zh"],
+    "nplurals=2; plural=(n != 1);": ["af", "bg", "bn", "ca", "da", "de", "el", "en", "eo", "es", "et", "eu", "fi", "fy", "gl", "he", "hi", "hu", "hy", "it", "ka", "kk", "nb", "ne", "nl", "nn", "no", "pa", "ps", "pt", "sq", "sv", "sw", "ta", "te", "tr", "ur", "uz"],
+    "nplurals=2; plural=(n > 1);": ["br", "fa", "fil", "fr", "oc", "pt_BR", "tl"],
+    "nplurals=3; plural=(n%10==1 && n%100!=11 ? 0 : n%10>=2 && n%10<=4 && (n%100<10 || n%100>=20) ? 1 : 2);": ["be", "bs", "hr", "ru", "sr", "uk"],
+    "nplurals=3; plural=(n==1 ? 0 : n%10>=2 && n%10<=4 && (n%100<10 || n%100>=20) ? 1 : 2);": ["pl"],
+    "nplurals=3; plural=(n==1) ? 0 : (n>=2 && n<=4) ? 1 : 2;": ["cs", "sk"],
+    "nplurals=3; plural=(n%10==1 && n%100!=11 ? 0 : n%10>=2 && (n%100<10 || n%100>=20) ? 1 : 2);": ["lt"],
+    "nplurals=3; plural=(n%10==1 && n%100!=11 ? 0 : n != 0 ? 1 : 2);": ["lv"],
+    "nplurals=3; plural=(n==1 ? 0 : (n==0 || (n%100 > 0 && n%100 < 20)) ? 1 : 2);": ["ro"],
+    "nplurals=4; plural=(n%100==1 ? 0 : n%100==2 ? 1 : n%100==3 || n%100==4 ? 2 : 3);": ["sl"],
+    "nplurals=5; plural=(n==1 ? 0 : n==2 ? 1 : n<7 ? 2 : n<11 ? 3 : 4);": ["ga"],
+    "nplurals=6; plural=(n==0 ? 0 : n==1 ? 1 : n==2 ? 2 : n%100>=3 && n%100<=10 ? 3 : n%100>=11 ? 4 : 5);": ["ar"],
+}
+PO_PLURAL_FORMS = {lng: value for value, lngs in PO_PLURAL_FORMS.items() for lng in lngs}
+
+
+def po_plural_forms(po, lng):
+    # Returns the number of plural forms of the file, the header is set/corrected for known languages.
+    value = po.metadata.get("Plural-Forms", "")
+    lng = lng.replace("-", "_")
+    value_lng = PO_PLURAL_FORMS.get(lng, PO_PLURAL_FORMS.get(lng.split("_")[0]))
+    if value_lng and po_plural_count(value) != po_plural_count(value_lng):
+        po.metadata["Plural-Forms"] = value_lng
+        value = value_lng
+    return po_plural_count(value) or 2
+
+
+def po_plural_count(value):
+    match = re.search(r"nplurals\s*=\s*(\d+)", value or "")
+    return int(match.group(1)) if match else None
+
+
+def po_plural_indexes(nplurals, plural):
+    # Forms which get the translation of the singular (0) or plural (1) text, with only one form (e.g. ja, zh) the plural text is used.
+    if plural == 0:
+        return [0] if nplurals > 1 else []
+    return list(range(1 if nplurals > 1 else 0, nplurals))
+
+
+def po_plural_translated(entry, nplurals):
+    return all([entry.msgstr_plural.get(index) for index in range(nplurals)])
+
+
+def po_fingerprint(po, source=True):
+    # Hash of every source entry (context, msgid, plural, source text), used to find added/changed entries.
+    # A single file (-f) is its own source, its msgstr are the translations and not part of the hash.
+    fingerprint = {}
+    for entry in po:
+        if entry.obsolete:
+            continue
+        value = [entry.msgctxt or "", entry.msgid, entry.msgid_plural or ""]
+        if source:
+            value += [entry.msgstr] + [entry.msgstr_plural[index] for index in sorted(entry.msgstr_plural)]
+        value = "\x04".join(value)
+        fingerprint[job_key(entry)] = hashlib.sha256(value.encode("utf-8")).digest()[:16]
+    return fingerprint
+
+
+def po_fingerprint_load(file):
+    try:
+        fh = open(file+".fingerprint", "rb")
+        data = umsgpack.unpackb(fh.read())
+        fh.close()
+    except FileNotFoundError:
+        return None, None
+    except Exception as e:
+        log(str(e), LOG_ERROR)
+        return None, None
+    fingerprint = {(msgctxt, msgid): value for msgctxt, msgid, value in data["source"]}
+    pending = set([(msgctxt, msgid) for msgctxt, msgid in data["pending"]])
+    return fingerprint, pending
+
+
+def po_fingerprint_save(file, fingerprint, pending):
+    # The entries which are still untranslated (errors, skipped) are checked again in the next run.
+    data = {
+        "source": [[key[0], key[1], value] for key, value in fingerprint.items()],
+        "pending": [[key[0], key[1]] for key in pending],
+    }
+    fh = open(file+".fingerprint.tmp", "wb")
+    fh.write(umsgpack.packb(data))
+    fh.close()
+    os.replace(file+".fingerprint.tmp", file+".fingerprint")
+
+
+def po_journal_open(file):
+    return open(file+".journal", "ab")
+
+
+def po_journal_write(journal, entry):
+    journal.write(umsgpack.packb({
+        "msgid": entry.msgid,
+        "msgctxt": entry.msgctxt,
+        "msgstr": entry.msgstr,
+        "msgstr_plural": entry.msgstr_plural,
+        "fuzzy": entry.fuzzy,
+    }))
+    journal.flush()
+
+
+def po_journal_reset(journal):
+    journal.seek(0)
+    journal.truncate()
+    journal.flush()
+
+
+def po_journal_close(journal, remove=True):
+    journal.close()
+    if remove and os.path.isfile(journal.name):
+        os.remove(journal.name)
+
+
+def po_journal_replay(po, file):
+    # Apply the entries of an interrupted run which were not yet saved in the .po file.
+    if not os.path.isfile(file+".journal"):
+        return 0
+    index = {}
+    for entry in po:
+        index[(entry.msgctxt, entry.msgid)] = entry
+    count = 0
+    fh = open(file+".journal", "rb")
+    while True:
+        try:
+            record = umsgpack.unpack(fh)
+        except Exception:
+            break
+        entry = index.get((record["msgctxt"], record["msgid"]))
+        if entry is None:
+            continue
+        entry.msgstr = record["msgstr"]
+        if record["msgstr_plural"]:
+            entry.msgstr_plural = record["msgstr_plural"]
+        entry.fuzzy = record["fuzzy"]
+        count += 1
+    fh.close()
+    return count
+
+
+##############################################################################################################
+# Job
+
+
+def job_header(po, file_src, lng_src, lng_dst, translator):
+    sha = hashlib.sha256()
+    if file_src:
+        fh = open(file_src, "rb")
+        sha.update(fh.read())
+        fh.close()
+    else:
+        for entry in po:
+            sha.update(((entry.msgctxt or "")+"\x04"+entry.msgid+"\x00").encode("utf-8"))
+    return {"source": sha.hexdigest(), "translator": translator, "lng_src": lng_src, "lng_dst": lng_dst}
+
+
+def job_open(file, header, resume=False):
+    # The job file contains the header followed by the keys of all completed entries.
+    done = set()
+    if resume and os.path.isfile(file+".job"):
+        fh = open(file+".job", "rb")
+        try:
+            if umsgpack.unpack(fh) == header:
+                while True:
+                    done.add(tuple(umsgpack.unpack(fh)))
+        except Exception:
+            pass
+        fh.close()
+
+    if done:
+        job = open(file+".job", "ab")
+    else:
+        job = open(file+".job", "wb")
+        job.write(umsgpack.packb(header))
+        job.flush()
+    return job, done
+
+
+def job_key(entry):
+    return (entry.msgctxt or "", entry.msgid)
+
+
+def job_source(group):
+    # An entry is counted once, the variants of a plural entry by the one with the most effort.
+    sources = ["memory" if "memory" in job else "cache" if job["cached"] else "duplicate" if "duplicate" in job else "online" for job in group]
+    for source in ["online", "duplicate", "memory", "cache"]:
+        if source in sources:
+            return source
+
+
+def job_write(job, entry):
+    job.write(umsgpack.packb(list(job_key(entry))))
+    job.flush()
+
+
+def job_close(job, remove=True):
+    job.close()
+    if remove and os.path.isfile(job.name):
+        os.remove(job.name)
+
+
+##############################################################################################################
+# Metrics
+
+
+METRICS = {"lock": threading.Lock()}
+
+
+def metrics_reset():
+    # The dict and the lock are kept, other threads (server mode) may record values at the same time.
+    with METRICS["lock"]:
+        METRICS.update({
+            "phases": {"import": TIME_IMPORT},
+            "latency": {},
+            "results": [],
+            "retries": 0,
+        })
+
+
+@contextlib.contextmanager
+def metrics_phase(name):
+    time_start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics_add(name, time.perf_counter() - time_start)
+
+
+def metrics_add(name, seconds):
+    with METRICS["lock"]:
+        METRICS["phases"][name] = METRICS["phases"].get(name, 0.0) + seconds
+
+
+def metrics_latency(translator, seconds):
+    with METRICS["lock"]:
+        METRICS["latency"].setdefault(translator, []).append(seconds)
+
+
+def metrics_retry(count=1):
+    with METRICS["lock"]:
+        METRICS["retries"] += count
+
+
+def metrics_percentile(values, percent):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(percent / 100.0 * (len(values) - 1))))]
+
+
+def metrics_summary():
+    with METRICS["lock"]:
+        summary = {
+            "phases": {key: round(value, 6) for key, value in METRICS["phases"].items()},
+            "providers": {},
+            "results": [{key: value for key, value in result.items()} for result in METRICS["results"]],
+            "retries": METRICS["retries"],
+        }
+        for translator, values in METRICS["latency"].items():
+            summary["providers"][translator] = {
+                "requests": len(values),
+                "seconds": round(sum(values), 6),
+                "p50": round(metrics_percentile(values, 50), 6),
+                "p95": round(metrics_percentile(values, 95), 6),
+                "p99": round(metrics_percentile(values, 99), 6),
+            }
+    translated = sum([result.get("translated_online", 0) for result in summary["results"]])
+    duration = summary["phases"].get("translate", 0.0)
+    summary["throughput"] = round(translated / duration, 3) if duration else 0.0
+    return summary
+
+
+def metrics_label(value):
+    # Label values of the Prometheus text format (file names may contain any character)
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def metrics_export(file, format="json"):
+    summary = metrics_summary()
+    if format == "prometheus":
+        lines = []
+        lines.append("# HELP potranslator_phase_seconds Time spent in the phases of the last run")
+        lines.append("# TYPE potranslator_phase_seconds gauge")
+        for key, value in summary["phases"].items():
+            lines.append('potranslator_phase_seconds{phase="'+metrics_label(key)+'"} '+str(value))
+        lines.append("# HELP potranslator_request_seconds Latency of the requests to the translation service provider")
+        lines.append("# TYPE potranslator_request_seconds summary")
+        for translator, value in summary["providers"].items():
+            for quantile in ["p50", "p95", "p99"]:
+                lines.append('potranslator_request_seconds{translator="'+metrics_label(translator)+'",quantile="0.'+quantile[1:]+'"} '+str(value[quantile]))
+            lines.append('potranslator_request_seconds_sum{translator="'+metrics_label(translator)+'"} '+str(value["seconds"]))
+            lines.append('potranslator_request_seconds_count{translator="'+metrics_label(translator)+'"} '+str(value["requests"]))
+        lines.append("# HELP potranslator_entries Entries of the last run by result")
+        lines.append("# TYPE potranslator_entries gauge")
+        for result in summary["results"]:
+            for key in ["count", "skipped", "forced", "translated_cache", "translated_memory", "translated_online", "translated_duplicate", "error"]:
+                if key in result:
+                    lines.append('potranslator_entries{file="'+metrics_label(result["file"])+'",lng_dst="'+metrics_label(result["lng_dst"])+'",result="'+key+'"} '+str(result[key]))
+        lines.append("# HELP potranslator_chars Characters sent to the translation service provider in the last run")
+        lines.append("# TYPE potranslator_chars gauge")
+        for result in summary["results"]:
+            lines.append('potranslator_chars{file="'+metrics_label(result["file"])+'",lng_dst="'+metrics_label(result["lng_dst"])+'"} '+str(result.get("chars", 0)))
+        lines.append("# HELP potranslator_retries Repeated requests of the last run")
+        lines.append("# TYPE potranslator_retries gauge")
+        lines.append("potranslator_retries "+str(summary["retries"]))
+        lines.append("# HELP potranslator_throughput Translated entries per second of the last run")
+        lines.append("# TYPE potranslator_throughput gauge")
+        lines.append("potranslator_throughput "+str(summary["throughput"]))
+        data = "\n".join(lines)+"\n"
+    else:
+        data = json.dumps(summary, indent=2)
+
+    # Write to a temporary file first, so that a collector never reads a partial file.
+    fh = open(file+".tmp", "w")
+    fh.write(data)
+    fh.close()
+    os.replace(file+".tmp", file)
+
+
+metrics_reset()
 
 
 ##############################################################################################################
@@ -114,56 +1543,163 @@ LOG_MAXSIZE       = 5*1024*1024
 LOG_PREFIX        = ""
 LOG_SUFFIX        = ""
 LOG_FILE          = ""
+LOG_CONSOLE       = None  # None: stdout
+LOG_BUFFER        = 64*1024
+LOG_QUEUE         = None
+LOG_QUEUE_THREAD  = None
+
+LOG_NAMES = {
+    LOG_FORCE:    "",
+    LOG_CRITICAL: "Critical",
+    LOG_ERROR:    "Error",
+    LOG_WARNING:  "Warning",
+    LOG_NOTICE:   "Notice",
+    LOG_INFO:     "Info",
+    LOG_VERBOSE:  "Verbose",
+    LOG_DEBUG:    "Debug",
+    LOG_EXTREME:  "Extra",
+}
+
+LOG_LOCK = threading.Lock()
+LOG_HANDLES = {}
+LOG_TIME = [None, ""]
 
 
 def log(text, level=3, file=None):
-    if not LOG_LEVEL:
+    # The level is checked first, so suppressed messages cost a single comparison.
+    # The text can be a callable which is only evaluated if the message is written.
+    if not LOG_LEVEL or LOG_LEVEL < level:
         return
 
-    if LOG_LEVEL >= level:
-        name = "Unknown"
-        if (level == LOG_FORCE):
-            name = ""
-        if (level == LOG_CRITICAL):
-            name = "Critical"
-        if (level == LOG_ERROR):
-            name = "Error"
-        if (level == LOG_WARNING):
-            name = "Warning"
-        if (level == LOG_NOTICE):
-            name = "Notice"
-        if (level == LOG_INFO):
-            name = "Info"
-        if (level == LOG_VERBOSE):
-            name = "Verbose"
-        if (level == LOG_DEBUG):
-            name = "Debug"
-        if (level == LOG_EXTREME):
-            name = "Extra"
-
-        if not isinstance(text, str):
-            text = str(text)
-
-        text = "[" + time.strftime(LOG_TIMEFMT, time.localtime(time.time())) +"] [" + name + "] " + LOG_PREFIX + text + LOG_SUFFIX
-
-        if file == None and LOG_FILE != "":
-            file = LOG_FILE
-
-        if file == None:
-            print(text)
-        else:
+    if callable(text):
+        text = text()
+
+    if file == None and LOG_FILE != "":
+        file = LOG_FILE
+
+    if LOG_QUEUE:
+        LOG_QUEUE.put((time.time(), text, level, file))
+    else:
+        log_write(time.time(), text, level, file)
+
+
+def log_format(now, text, level):
+    if not isinstance(text, str):
+        text = str(text)
+
+    second = int(now)
+    if LOG_TIME[0] != second:
+        LOG_TIME[1] = time.strftime(LOG_TIMEFMT, time.localtime(second))
+        LOG_TIME[0] = second
+
+    return "[" + LOG_TIME[1] + "] [" + LOG_NAMES.get(level, "Unknown") + "] " + LOG_PREFIX + text + LOG_SUFFIX
+
+
+def log_write(now, text, level, file):
+    try:
+        text = log_format(now, text, level)
+    except Exception:
+        return
+
+    if file == None:
+        print(text, file=LOG_CONSOLE)
+        return
+
+    try:
+        with LOG_LOCK:
+            handle = LOG_HANDLES.get(file)
+            if not handle:
+                fd = os.open(file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                handle = {"fd": fd, "size": os.fstat(fd).st_size, "buffer": [], "buffer_size": 0}
+                LOG_HANDLES[file] = handle
+            data = (text + "\n").encode("utf-8", "replace")
+            handle["buffer"].append(data)
+            handle["buffer_size"] += len(data)
+            if handle["buffer_size"] >= LOG_BUFFER or level <= LOG_ERROR:
+                log_flush_handle(file, handle)
+    except Exception:
+        return
+
+
+def log_flush_handle(file, handle):
+    # Called with LOG_LOCK held. The size is tracked here, no stat call per message.
+    if handle["buffer"]:
+        data = b"".join(handle["buffer"])
+        handle["buffer"] = []
+        handle["buffer_size"] = 0
+        os.write(handle["fd"], data)
+        handle["size"] += len(data)
+
+    if handle["size"] > LOG_MAXSIZE:
+        os.close(handle["fd"])
+        file_prev = file + ".1"
+        if os.path.isfile(file_prev):
+            os.unlink(file_prev)
+        os.rename(file, file_prev)
+        handle["fd"] = os.open(file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        handle["size"] = 0
+
+
+def log_flush():
+    with LOG_LOCK:
+        for file, handle in LOG_HANDLES.items():
             try:
-                file_handle = open(file, "a")
-                file_handle.write(text + "\n")
-                file_handle.close()
-
-                if os.path.getsize(file) > LOG_MAXSIZE:
-                    file_prev = file + ".1"
-                    if os.path.isfile(file_prev):
-                        os.unlink(file_prev)
-                    os.rename(file, file_prev)
-            except:
-                return
+                log_flush_handle(file, handle)
+            except Exception:
+                pass
+
+
+def log_close():
+    log_queue_stop()
+    log_flush()
+    with LOG_LOCK:
+        for handle in LOG_HANDLES.values():
+            try:
+                os.close(handle["fd"])
+            except Exception:
+                pass
+        LOG_HANDLES.clear()
+
+
+def log_reset():
+    # Used in forked worker processes: the buffered messages belong to the parent process.
+    global LOG_QUEUE, LOG_QUEUE_THREAD, LOG_LOCK
+    LOG_QUEUE = None
+    LOG_QUEUE_THREAD = None
+    LOG_LOCK = threading.Lock()
+    LOG_HANDLES.clear()
+
+
+def log_queue_start():
+    # Messages are formatted and written by a background thread, the caller only enqueues them.
+    global LOG_QUEUE, LOG_QUEUE_THREAD
+    if LOG_QUEUE:
+        return
+    LOG_QUEUE = queue.SimpleQueue()
+    LOG_QUEUE_THREAD = threading.Thread(target=log_queue_run, args=(LOG_QUEUE,), daemon=True)
+    LOG_QUEUE_THREAD.start()
+
+
+def log_queue_run(log_queue):
+    while True:
+        record = log_queue.get()
+        if record is None:
+            break
+        log_write(*record)
+
+
+def log_queue_stop():
+    global LOG_QUEUE, LOG_QUEUE_THREAD
+    if not LOG_QUEUE:
+        return
+    log_queue = LOG_QUEUE
+    LOG_QUEUE = None
+    log_queue.put(None)
+    LOG_QUEUE_THREAD.join()
+    LOG_QUEUE_THREAD = None
+
+
+atexit.register(log_close)
 
 
 ##############################################################################################################
@@ -180,6 +1716,327 @@ def exit():
     sys.exit(0)
 
 
+##############################################################################################################
+# Serve
+
+
+# State of the server mode: translator, cache and rate limiter stay loaded between the requests.
+SERVE = {}
+SERVE_LOCK = threading.Lock()
+SERVE_STATS_LOCK = threading.Lock()
+SERVE_LANGUAGE_REGEX = re.compile(r"^[A-Za-z]{2,3}([_-][A-Za-z0-9]+)*$")
+SERVE_FILE_OPTIONS = ["path", "file", "recursive", "lng_src", "lng_dst", "force", "incremental", "resume", "dry_run", "fuzzy", "fuzzy_enable", "fuzzy_disable", "msgid_force", "msgid_force_original", "translation_memory", "autosave", "parallel"]
+
+
+def serve_status():
+    return {
+        "version": __version__,
+        "translator": SERVE["translator"],
+        "lng_src": SERVE["lng_src"],
+        "lng_dst": SERVE["lng_dst"],
+        "cache": SERVE["cache_backend"] if SERVE["cache"] else None,
+        "uptime": round(time.time() - SERVE["time_start"], 1),
+        "requests": SERVE["requests"],
+        "texts": SERVE["texts"],
+    }
+
+
+def serve_loopback(host):
+    import ipaddress
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def serve_path_allowed(path):
+    return setup_path_allowed(path, SERVE["file_root"])
+
+
+def serve_languages(value, name):
+    # The languages are part of the file paths, only plain locale codes are accepted.
+    if not isinstance(value, str) or not value:
+        raise ValueError("Missing '"+name+"'")
+    for lng in value.split(","):
+        if not SERVE_LANGUAGE_REGEX.match(lng.strip()):
+            raise ValueError("Invalid language code '"+lng+"' in '"+name+"'")
+    return value
+
+
+def serve_translate(request):
+    texts = request.get("texts")
+    if isinstance(texts, str):
+        texts = [texts]
+    if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+        raise ValueError("'texts' must be a list of strings")
+    lng_src = request.get("lng_src", SERVE["lng_src"])
+    lng_dst = request.get("lng_dst", SERVE["lng_dst"][0] if SERVE["lng_dst"] else None)
+    serve_languages(lng_src, "lng_src")
+    serve_languages(lng_dst, "lng_dst")
+    if "," in lng_dst:
+        raise ValueError("Only one target language is possible")
+    if lng_src == lng_dst:
+        raise ValueError("Source and target language are the same")
+
+    with SERVE_LOCK:
+        setup_translate(lng_src=lng_src, lng_dst=lng_dst, translator=SERVE["translator"], translator_key=SERVE["translator_key"])
+
+    result = {"texts": [], "errors": []}
+    for text_dst, error in translate_texts(texts, lng_src, lng_dst, SERVE["translator"], cache=SERVE["cache"], cache_read=SERVE["cache_read"], cache_write=SERVE["cache_write"], replace_src=SERVE["replace_src"], replace_dst=SERVE["replace_dst"], mask=SERVE["mask"], workers=SERVE["workers"], batch_size=SERVE["batch_size"], limiter=SERVE["limiter"], retries=SERVE["retries"]):
+        result["texts"].append(text_dst)
+        result["errors"].append(str(error) if error else None)
+
+    if SERVE["cache_write"]:
+        cache_save(SERVE["cache"])
+
+    with SERVE_STATS_LOCK:
+        SERVE["texts"] += len(texts)
+    return result
+
+
+def serve_translate_file(request):
+    if SERVE["file_root"] is None:
+        raise PermissionError("File translations are disabled (--host is not a loopback address, see --file_root)")
+    params = {key: value for key, value in request.items() if key in SERVE_FILE_OPTIONS}
+    for key in ["path", "file"]:
+        if params.get(key) is not None and not serve_path_allowed(params[key]):
+            raise PermissionError("'"+str(params[key])+"' is not below --file_root")
+    params.setdefault("lng_src", SERVE["lng_src"])
+    params.setdefault("lng_dst", ",".join(SERVE["lng_dst"]))
+    serve_languages(params["lng_src"], "lng_src")
+    serve_languages(params["lng_dst"], "lng_dst")
+
+    # setup() uses global state (metrics, log level), the files are translated one after the other.
+    with SERVE_LOCK:
+        setup(translator=SERVE["translator"], translator_key=SERVE["translator_key"], cache_read=SERVE["cache_read"], cache_write=SERVE["cache_write"], cache_handle=SERVE["cache"], retries=SERVE["retries"], replace_both=SERVE["replace_both"], replace_src=SERVE["replace_src_text"], replace_dst=SERVE["replace_dst_text"], glossary=SERVE["glossary"], mask=SERVE["mask"], workers=SERVE["workers"], batch_size=SERVE["batch_size"], limiter=SERVE["limiter"], file_root=SERVE["file_root"], **params)
+        return {"results": METRICS["results"]}
+
+
+def serve_socket_remove(file):
+    # Only a (stale) socket is removed, never another file at this path.
+    if not os.path.lexists(file):
+        return True
+    if not stat.S_ISSOCK(os.lstat(file).st_mode):
+        return False
+    os.remove(file)
+    return True
+
+
+def serve_server(host="127.0.0.1", port=8765, socket_file=None):
+    # Only imported in the server mode, they would slow down the start of every other command.
+    import socketserver
+    import http.server
+
+    class ServeHandler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            log(lambda: "Serve: " + (format % args), LOG_DEBUG)
+
+        def send_json(self, status, data):
+            body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/status":
+                self.send_json(200, serve_status())
+            else:
+                self.send_json(404, {"error": "Not found"})
+
+        def do_POST(self):
+            with SERVE_STATS_LOCK:
+                SERVE["requests"] += 1
+            if self.path not in ["/translate", "/translate_file"]:
+                self.send_json(404, {"error": "Not found"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length).decode("utf-8")) if length else {}
+                if not isinstance(request, dict):
+                    raise ValueError("The request must be a JSON object")
+            except Exception as e:
+                self.send_json(400, {"error": str(e)})
+                return
+            try:
+                if self.path == "/translate":
+                    self.send_json(200, serve_translate(request))
+                else:
+                    self.send_json(200, serve_translate_file(request))
+            except ValueError as e:
+                self.send_json(400, {"error": str(e)})
+            except PermissionError as e:
+                self.send_json(403, {"error": str(e)})
+            except SystemExit:
+                # panic() of the setup functions, the details are in the log
+                self.send_json(500, {"error": "Translation failed (see log)"})
+            except Exception as e:
+                log("Serve: " + str(e), LOG_ERROR)
+                self.send_json(500, {"error": str(e)})
+
+
+    class ServeUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+        def get_request(self):
+            # BaseHTTPRequestHandler expects a (host, port) client address
+            request, _ = super().get_request()
+            return request, ("unix", 0)
+
+    if socket_file:
+        if not serve_socket_remove(socket_file):
+            raise FileExistsError("'"+socket_file+"' exists and is not a socket")
+        return ServeUnixServer(socket_file, ServeHandler)
+    return http.server.ThreadingHTTPServer((host, port), ServeHandler)
+
+
+##############################################################################################################
+# Stream
+
+
+STREAM_FORMATS = ["po", "lines", "jsonl"]
+
+
+def stream_windows(items, size):
+    window = []
+    for item in items:
+        window.append(item)
+        if len(window) >= size:
+            yield window
+            window = []
+    if window:
+        yield window
+
+
+def stream_po_blocks(fh):
+    # The entries of a .po file are separated by empty lines, only one entry is held in memory.
+    block = []
+    for line in fh:
+        if line.strip() == "":
+            if block:
+                yield "".join(block)
+                block = []
+        else:
+            block.append(line)
+    if block:
+        yield "".join(block)
+
+
+def stream_translate(texts, lng_src, lng_dst, options, stats):
+    for text_dst, error in translate_texts(texts, lng_src, lng_dst, **options):
+        if error:
+            stats["error"] += 1
+            log("Error: " + str(error), LOG_ERROR)
+        elif text_dst != "":
+            stats["translated"] += 1
+        yield text_dst, error
+    if options["cache_write"]:
+        cache_save(options["cache"])
+
+
+def stream_po(fh_in, fh_out, lng_src, lng_dst, options, window=100, force=False):
+    stats = {"count": 0, "translated": 0, "error": 0}
+    nplurals = None
+    first = True
+    for blocks in stream_windows(stream_po_blocks(fh_in), window):
+        try:
+            po = polib.pofile("\n".join(blocks))
+        except Exception as e:
+            log("Invalid .po input: " + str(e), LOG_ERROR)
+            panic()
+
+        if nplurals is None:
+            nplurals = po_plural_forms(po, lng_dst)
+            if po.metadata or po.header:
+                if po.metadata:
+                    po.metadata["Language"] = lng_dst
+                header = polib.POFile(wrapwidth=po.wrapwidth)
+                header.header = po.header
+                header.metadata = po.metadata
+                header.metadata_is_fuzzy = po.metadata_is_fuzzy
+                fh_out.write(str(header))
+                first = False
+
+        texts = []
+        targets = []
+        for entry in po:
+            if entry.obsolete or entry.msgid == "":
+                continue
+            stats["count"] += 1
+            if entry.msgid_plural:
+                if force or not po_plural_translated(entry, nplurals):
+                    entry.msgstr_plural = {index: "" for index in range(nplurals)}
+                    for plural, text in [(0, entry.msgid), (1, entry.msgid_plural)]:
+                        if po_plural_indexes(nplurals, plural):
+                            texts.append(text)
+                            targets.append((entry, plural))
+            elif force or not entry.msgstr:
+                texts.append(entry.msgid)
+                targets.append((entry, None))
+
+        for (entry, plural), (text_dst, error) in zip(targets, stream_translate(texts, lng_src, lng_dst, options, stats)):
+            if error:
+                continue
+            if plural is None:
+                entry.msgstr = text_dst
+            else:
+                for index in po_plural_indexes(nplurals, plural):
+                    entry.msgstr_plural[index] = text_dst
+
+        for entry in po:
+            fh_out.write(("" if first else "\n") + str(entry))
+            first = False
+        fh_out.flush()
+    return stats
+
+
+def stream_lines(fh_in, fh_out, lng_src, lng_dst, options, window=100, jsonl=False):
+    # One text per line (line breaks of the translations are replaced) or one JSON string/object with "text" per line.
+    stats = {"count": 0, "translated": 0, "error": 0}
+    for lines in stream_windows(fh_in, window):
+        items = []
+        for line in lines:
+            line = line.rstrip("\r\n")
+            item = line
+            if jsonl:
+                try:
+                    item = json.loads(line) if line.strip() != "" else None
+                except ValueError as e:
+                    log("Invalid JSON line: " + str(e), LOG_ERROR)
+                    item = None
+            items.append((line, item))
+
+        texts = []
+        for line, item in items:
+            if isinstance(item, dict) and isinstance(item.get("text"), str):
+                texts.append(item["text"])
+            elif isinstance(item, str):
+                texts.append(item)
+            else:
+                texts.append("")
+        stats["count"] += len([text for text in texts if text != ""])
+
+        for (line, item), (text_dst, error) in zip(items, stream_translate(texts, lng_src, lng_dst, options, stats)):
+            if not jsonl:
+                fh_out.write((line if error else text_dst.replace("\r", "").replace("\n", " ")) + "\n")
+            elif isinstance(item, dict) and isinstance(item.get("text"), str):
+                item["translation"] = text_dst
+                if error:
+                    item["error"] = str(error)
+                fh_out.write(json.dumps(item, ensure_ascii=False) + "\n")
+            elif isinstance(item, str):
+                fh_out.write(json.dumps(item if error else text_dst, ensure_ascii=False) + "\n")
+            else:
+                fh_out.write(line + "\n")
+        fh_out.flush()
+    return stats
+
+
 ##############################################################################################################
 # Setup/Start
 
@@ -188,6 +2045,12 @@ def exit():
 def setup_translate(lng_src, lng_dst, translator="", translator_key=None):
     global TRANSLATOR
 
+    # Already set up in this process (server mode).
+    if (translator, translator_key, lng_src, lng_dst) in TRANSLATOR_SETUP:
+        return
+    if any([key[:2] != (translator, translator_key) for key in TRANSLATOR_SETUP]):
+        TRANSLATOR_SETUP.clear()
+
     if translator == "argostranslate":
         try:
             import argostranslate.package
@@ -196,14 +2059,29 @@ def setup_translate(lng_src, lng_dst, translator="", translator_key=None):
             log("The 'argostranslate' module is not installed.", LOG_ERROR)
             panic()
         try:
-            argostranslate.package.update_package_index()
-            available_packages = argostranslate.package.get_available_packages()
-            package_to_install = next(
-                filter(
-                    lambda x: x.from_code == lng_src and x.to_code == lng_dst, available_packages
+            # The package index is only updated (online) if the language pair is not installed yet.
+            installed_packages = argostranslate.package.get_installed_packages()
+            if not any(x.from_code == lng_src and x.to_code == lng_dst for x in installed_packages):
+                log("Installing the 'argostranslate' package for '"+lng_src+"' -> '"+lng_dst+"'", LOG_NOTICE)
+                argostranslate.package.update_package_index()
+                available_packages = argostranslate.package.get_available_packages()
+                package_to_install = next(
+                    filter(
+                        lambda x: x.from_code == lng_src and x.to_code == lng_dst, available_packages
+                    )
                 )
-            )
-            argostranslate.package.install_from_path(package_to_install.download())
+                argostranslate.package.install_from_path(package_to_install.download())
+
+            # The translation (model) is loaded once and used for all translations of this process.
+            installed_languages = argostranslate.translate.get_installed_languages()
+            lng_from = next(filter(lambda x: x.code == lng_src, installed_languages))
+            lng_to = next(filter(lambda x: x.code == lng_dst, installed_languages))
+            if not isinstance(TRANSLATOR, dict):
+                TRANSLATOR = {}
+            TRANSLATOR[(lng_src, lng_dst)] = lng_from.get_translation(lng_to)
+        except StopIteration:
+            log("The 'argostranslate' package for '"+lng_src+"' -> '"+lng_dst+"' is not available", LOG_ERROR)
+            panic()
         except Exception as e:
             log(str(e), LOG_ERROR)
             panic()
@@ -232,6 +2110,20 @@ def setup_translate(lng_src, lng_dst, translator="", translator_key=None):
             log(str(e), LOG_ERROR)
             panic()
 
+    elif translator == "mock":
+        # Options: latency=<ms per request>,error=<error rate 0-1>,throttle=<max requests per second>,mangle=<placeholder loss rate 0-1>
+        TRANSLATOR = {"latency": 0.0, "error": 0.0, "throttle": 0.0, "mangle": 0.0, "lock": threading.Lock(), "requests": collections.deque()}
+        try:
+            for part in (translator_key or "").split(","):
+                if "=" in part:
+                    key, value = part.split("=", 1)
+                    if key not in ["latency", "error", "throttle", "mangle"]:
+                        raise ValueError("Unknown mock option '"+key+"'")
+                    TRANSLATOR[key] = float(value)
+        except Exception as e:
+            log(str(e), LOG_ERROR)
+            panic()
+
     else:
         try:
             import translators
@@ -243,30 +2135,69 @@ def setup_translate(lng_src, lng_dst, translator="", translator_key=None):
             log("The 'translators' module is not installed.", LOG_ERROR)
             panic()
 
+    TRANSLATOR_SETUP.add((translator, translator_key, lng_src, lng_dst))
+
+
+#### Setup replace ####
+def setup_replace(replace_both=None, replace_src=None, replace_dst=None, glossary=None):
+    if replace_both:
+        replace_src = replace_parse(replace_both)
+        replace_dst = {}
+        for key, value in replace_src.items():
+            replace_dst[value] = key
+    else:
+        replace_src = replace_parse(replace_src)
+        replace_dst = replace_parse(replace_dst)
+
+    if glossary:
+        try:
+            replace_load(glossary, replace_src, replace_dst)
+        except Exception as e:
+            log("Glossary file '"+glossary+"': "+str(e), LOG_ERROR)
+            panic()
+
+    return replace_compile(replace_src), replace_compile(replace_dst)
+
 
 #### Setup file ####
-def setup_file(path, lng_src, lng_dst, force=False):
+def setup_file(path, lng_src, lng_dst, name="LC_MESSAGES/base.po", force=False, resume=False, dry_run=False, file_root=None):
+    file_src = path+"/"+lng_src+"/"+name
+    file_dst = path+"/"+lng_dst+"/"+name
+
+    # Server mode: nothing outside of --file_root is read or written (e.g. "../" in the languages, symlinks)
+    for file in [file_src, file_dst]:
+        if not setup_path_allowed(file, file_root):
+            raise PermissionError("'"+file+"' is not below --file_root")
+
     try:
-        file_src = path+"/"+lng_src+"/LC_MESSAGES/base.po"
-        file_dst = path+"/"+lng_dst+"/LC_MESSAGES/base.po"
 
         if not os.path.isfile(file_src):
             log("Source file '"+file_src+"' not found", LOG_ERROR)
             panic()
 
-        if not os.path.exists(path+"/"+lng_dst+"/LC_MESSAGES"):
-            os.makedirs(path+"/"+lng_dst+"/LC_MESSAGES")
+        if dry_run:
+            if force or not os.path.isfile(file_dst):
+                return file_src, None
+            return file_src, file_dst
 
-        if force:
+        if not os.path.exists(os.path.dirname(file_dst)):
+            os.makedirs(os.path.dirname(file_dst))
+
+        if force and not (resume and os.path.isfile(file_dst+".job")):
             if os.path.isfile(file_dst):
                 os.remove(file_dst)
 
         if not os.path.isfile(file_dst):
+            if os.path.isfile(file_dst+".fingerprint"):
+                os.remove(file_dst+".fingerprint")
             shutil.copyfile(file_src, file_dst)
-            po = polib.pofile(file_dst)
+            po = po_load(file_dst)
+            nplurals = po_plural_forms(po, lng_dst)
             for entry in po:
                 entry.msgstr = ""
-            po.save()
+                if entry.msgid_plural:
+                    entry.msgstr_plural = {index: "" for index in range(nplurals)}
+            po_save(po, file_dst)
 
         return file_src, file_dst
     except Exception as e:
@@ -274,15 +2205,395 @@ def setup_file(path, lng_src, lng_dst, force=False):
         panic()
 
 
+#### Setup path allowed ####
+def setup_path_allowed(path, roots):
+    if not roots:
+        return True
+    path = os.path.realpath(path)
+    return any([path == root or path.startswith(root.rstrip(os.sep) + os.sep) for root in roots])
+
+
+#### Setup files ####
+def setup_files(path, lng_src):
+    # All .po files below the source language folder (relative paths)
+    files = []
+    for root, dirs, names in os.walk(path+"/"+lng_src):
+        dirs.sort()
+        for name in sorted(names):
+            if name.endswith(".po"):
+                files.append(os.path.relpath(os.path.join(root, name), path+"/"+lng_src).replace(os.sep, "/"))
+    return files
+
+
+#### Setup language ####
+def setup_language(po_file_src, po_file_dst, po_dict, lng_src, lng_dst, translator, po_src=None, fingerprint=None, incremental=False, resume=False, dry_run=False, cache=None, cache_read=False, cache_write=False, autosave=50, fuzzy=False, fuzzy_enable=False, fuzzy_disable=False, msgid_force=None, msgid_force_original=None, replace_src=None, replace_dst=None, mask=True, translation_memory=0, workers=1, batch_size=1, limiter=None, retries=0, pool=None, shared=None):
+    log("Translating '" + lng_src + "' to '" + lng_dst + "' (" + (po_file_dst or po_file_src) + "). Please wait...", LOG_INFO)
+
+    if dry_run:
+        # Nothing is written, a not yet existing target file is simulated by an empty copy of the source file.
+        if po_file_dst:
+            po_dst = po_load(po_file_dst)
+        else:
+            po_dst = po_load(po_file_src)
+            for entry in po_dst:
+                entry.msgstr = ""
+                entry.msgstr_plural = {}
+        done = set()
+    else:
+        po_dst = po_load(po_file_dst)
+
+        count_replayed = po_journal_replay(po_dst, po_file_dst)
+        if count_replayed:
+            log(lng_dst+": Restored "+str(count_replayed)+" translations of an interrupted run", LOG_NOTICE)
+
+    # Incremental: only the entries which were added/changed in the source file since the last run (or are still untranslated).
+    changed = None
+    if incremental and fingerprint is not None and po_file_dst:
+        # New entries of the source file are added, removed ones are marked as obsolete (like msgmerge).
+        if set([job_key(entry) for entry in po_dst if not entry.obsolete]) != set(fingerprint):
+            po_dst.merge(po_src)
+        fingerprint_prev, pending_prev = po_fingerprint_load(po_file_dst)
+        if fingerprint_prev is not None:
+            changed = set([key for key, value in fingerprint.items() if fingerprint_prev.get(key) != value])
+            changed_source = set([key for key in changed if key in fingerprint_prev])
+            changed |= pending_prev
+            log(lng_dst+": "+str(len(changed))+" added/changed entries", LOG_INFO)
+
+    if not dry_run:
+        current_datetime = datetime.now()
+        po_dst.lang = lng_dst
+        po_dst.metadata['Language'] = lng_dst
+        po_dst.metadata['POT-Creation-Date'] = current_datetime.strftime('%Y-%m-%d %H:%M%z')
+        po_dst.metadata['PO-Revision-Date'] = current_datetime.strftime('%Y-%m-%d %H:%M%z')
+        po_plural_forms(po_dst, lng_dst)
+        po_save(po_dst, po_file_dst)
+
+        journal = po_journal_open(po_file_dst)
+        po_journal_reset(journal)
+
+        job_file, done = job_open(po_file_dst, job_header(po_dst, po_file_src, lng_src, lng_dst, translator), resume=resume)
+        if done:
+            log(lng_dst+": Resuming interrupted run ("+str(len(done))+" entries already done)", LOG_NOTICE)
+
+    nplurals = po_plural_forms(po_dst, lng_dst)
+
+    count = len(po_dst)
+    count_current = 0
+    count_skipped = 0
+    count_forced = 0
+    count_translated_cache = 0
+    count_translated_memory = 0
+    count_translated_online = 0
+    count_translated_duplicate = 0
+    count_error = 0
+    count_retries = 0
+    count_chars = 0
+
+    # Translation memory: near matches of the cache and of the already translated entries are used instead of a new translation (marked as fuzzy).
+    memory = None
+    if translation_memory:
+        with metrics_phase("memory_index"):
+            memory = tm_create()
+            if cache_read:
+                for text_src, text_dst in cache_items(cache, translator, lng_src+"_"+lng_dst):
+                    tm_add(memory, text_src, text_dst)
+            for entry in po_dst:
+                if entry.msgid and not entry.msgid_plural and not entry.obsolete and entry.translated():
+                    # Same form of the source text as the cache entries (after replace_src), the translation is already after replace_dst.
+                    tm_add(memory, replace_apply(replace_src, entry.msgid), entry.msgstr, final=True)
+
+    jobs = []
+    groups = []
+    pending = {}
+    for entry in po_dst:
+        count_current += 1
+
+        if not entry.msgid:
+            count_skipped += 1
+            continue
+
+        if done and job_key(entry) in done:
+            count_skipped += 1
+            continue
+
+        key = job_key(entry)
+
+        if changed is not None and key not in changed:
+            if not (msgid_force and msgid_force.search(entry.msgid)) and not (msgid_force_original and msgid_force_original.search(entry.msgid)):
+                count_skipped += 1
+                continue
+
+        # The source text has changed, the existing translation is outdated.
+        if changed is not None and key in changed_source:
+            entry.msgstr = ""
+            if entry.msgid_plural:
+                entry.msgstr_plural = {}
+
+        if msgid_force and msgid_force.search(entry.msgid):
+            entry.msgstr = ""
+            if entry.msgid_plural:
+                entry.msgstr_plural = {index: "" for index in range(nplurals)}
+            if fuzzy:
+                entry.fuzzy = False
+
+        if msgid_force_original and msgid_force_original.search(entry.msgid):
+            if entry.msgid_plural:
+                source = po_dict.get(key) or {}
+                for index in range(nplurals):
+                    if index == 0 and nplurals > 1:
+                        entry.msgstr_plural[index] = source.get(0) or entry.msgid
+                    else:
+                        entry.msgstr_plural[index] = source.get(1) or entry.msgid_plural
+            elif key in po_dict and po_dict[key] != "":
+                entry.msgstr = po_dict[key]
+            else:
+                entry.msgstr = entry.msgid
+            if fuzzy:
+                entry.fuzzy = False
+            count_forced += 1
+            continue
+
+        if entry.msgid_plural:
+            # Singular and plural text, all plural forms of the target language > 0 get the plural translation.
+            if po_plural_translated(entry, nplurals):
+                count_skipped += 1
+                continue
+            entry.msgstr_plural = {index: "" for index in range(nplurals)}
+            source = po_dict.get(key) or {}
+            variants = [(plural, source.get(plural) or text) for plural, text in [(0, entry.msgid), (1, entry.msgid_plural)] if po_plural_indexes(nplurals, plural)]
+        else:
+            if entry.msgstr != "":
+                count_skipped += 1
+                continue
+
+            if key in po_dict:
+                if entry.msgid == po_dict[key]:
+                    count_skipped += 1
+                    continue
+                if po_dict[key] != "":
+                    text_src = po_dict[key]
+                else:
+                    text_src = entry.msgid
+            else:
+                if entry.msgid == entry.msgstr:
+                    count_skipped += 1
+                    continue
+                text_src = entry.msgid
+            variants = [(None, text_src)]
+
+        group = []
+        for plural, text_src in variants:
+            text_src_replaced = replace_apply(replace_src, text_src)
+
+            job = {"entry": entry, "index": count_current, "plural": plural, "text_src": text_src, "text_src_replaced": text_src_replaced, "cache_key": text_src_replaced, "text_dst": "", "cached": False}
+
+            if cache_read:
+                text_dst = cache_get(cache, translator, lng_src+"_"+lng_dst, text_src_replaced, track=not dry_run)
+                if text_dst is not None:
+                    job["text_dst"] = text_dst
+                    job["cached"] = True
+
+            if not job["cached"] and memory:
+                text_dst, score, final = tm_lookup(memory, text_src_replaced, translation_memory)
+                if text_dst is not None:
+                    job["text_dst"] = text_dst
+                    job["cached"] = True
+                    job["memory"] = score
+                    job["final"] = final
+
+            if not job["cached"]:
+                if mask:
+                    job["text_src_replaced"], job["mask"] = mask_text(text_src_replaced)
+                    text_src_replaced = job["text_src_replaced"]
+                if text_src_replaced in pending:
+                    job["duplicate"] = pending[text_src_replaced]
+                else:
+                    pending[text_src_replaced] = job
+
+            group.append(job)
+            jobs.append(job)
+        groups.append(group)
+
+        # The variants of a plural entry are sent in the same request.
+        if len(group) > 1:
+            for job in group:
+                job["group"] = group
+
+    if dry_run:
+        return {
+            "file": po_file_dst or po_file_src,
+            "lng_dst": lng_dst,
+            "count": count,
+            "skipped": count_skipped,
+            "forced": count_forced,
+            "translate": len(groups),
+            "translated_cache": len([group for group in groups if job_source(group) == "cache"]),
+            "translated_memory": len([group for group in groups if job_source(group) == "memory"]),
+            "translated_duplicate": len([group for group in groups if job_source(group) == "duplicate"]),
+            "translated_online": len([group for group in groups if job_source(group) == "online"]),
+            "requests": translate_requests(pending.keys(), translator, batch_size),
+            "chars": sum([len(text) for text in pending.keys()]),
+        }
+
+    time_start = time.perf_counter()
+    i = 0
+    i_po = 0
+    for job in translate_jobs(jobs, lng_src, lng_dst, translator, workers=workers, batch_size=batch_size, limiter=limiter, retries=retries, pool=pool, shared=shared.get(lng_dst) if shared else None):
+        try:
+            count_retries += job.get("retries", 0)
+
+            if "duplicate" in job:
+                if "error" in job["duplicate"]:
+                    # Also for the later duplicates of this entry (which refer to this job)
+                    job["error"] = job["duplicate"]["error"]
+                    raise job["error"]
+                job["text_dst"] = job["duplicate"]["text_dst"]
+
+            if "error" in job:
+                raise job["error"]
+
+            entry = job["entry"]
+            text_src = job["text_src"]
+            text_dst = job["text_dst"]
+            cached = job["cached"]
+
+            if text_dst != "":
+                if "mask" in job:
+                    text_dst = mask_restore(text_dst, job["mask"])
+
+                # Same key as the lookup (source text after replace_src), the translation is stored before replace_dst.
+                if not cached and "duplicate" not in job and cache_write:
+                    cache_set(cache, translator, lng_src+"_"+lng_dst, job["cache_key"], text_dst)
+
+                if not job.get("final"):
+                    text_dst = replace_apply(replace_dst, text_dst)
+
+                text_dst = translate_punctuation(text_src, text_dst)
+
+                if job["plural"] is None:
+                    entry.msgstr = text_dst
+                else:
+                    for index in po_plural_indexes(nplurals, job["plural"]):
+                        entry.msgstr_plural[index] = text_dst
+
+                if fuzzy:
+                    if fuzzy_enable:
+                        entry.fuzzy = True
+                    elif fuzzy_disable:
+                        entry.fuzzy = False
+
+                # A translation of a similar text has to be reviewed.
+                if "memory" in job:
+                    entry.fuzzy = True
+
+                if job["plural"] is None or po_plural_translated(entry, nplurals):
+                    po_journal_write(journal, entry)
+                    job_write(job_file, entry)
+
+                i += 1
+                if i >= autosave:
+                    i = 0
+                    if cache_write:
+                        cache_save(cache)
+
+                # Every entry is already saved in the journal, rewriting the whole .po file at most ~10 times keeps the run linear on large files.
+                i_po += 1
+                if i_po >= max(autosave, count // 10):
+                    i_po = 0
+                    po_save(po_dst, po_file_dst)
+                    po_journal_reset(journal)
+
+                if "memory" in job:
+                    log(lambda: lng_dst+" "+str(job["index"])+"/"+str(count)+": "+text_src+" -> "+text_dst+" [MEMORY "+str(round(job["memory"]*100))+"%]", LOG_INFO)
+                elif cached:
+                    log(lambda: lng_dst+" "+str(job["index"])+"/"+str(count)+": "+text_src+" -> "+text_dst+" [CACHE]", LOG_INFO)
+                elif "duplicate" in job:
+                    log(lambda: lng_dst+" "+str(job["index"])+"/"+str(count)+": "+text_src+" -> "+text_dst+" [DUPLICATE]", LOG_INFO)
+                else:
+                    # Characters sent to the translator (after replace_src and masking), the same measure as in the dry run
+                    count_chars += len(job["text_src_replaced"])
+                    log(lambda: lng_dst+" "+str(job["index"])+"/"+str(count)+": "+text_src+" -> "+text_dst+" [ONLINE]", LOG_INFO)
+
+                job["translated"] = True
+
+        except Exception as e:
+            job["failed"] = True
+            log(str(e), LOG_ERROR)
+
+        # The variants of a plural entry are counted together after the last one (like "count", per entry).
+        job["done"] = True
+        group = job.get("group", [job])
+        if not all([item.get("done") for item in group]):
+            continue
+        if any([item.get("failed") for item in group]):
+            count_error += 1
+        elif all([item.get("translated") for item in group]):
+            source = job_source(group)
+            if source == "memory":
+                count_translated_memory += 1
+            elif source == "cache":
+                count_translated_cache += 1
+            elif source == "duplicate":
+                count_translated_duplicate += 1
+            else:
+                count_translated_online += 1
+
+    time_translate = time.perf_counter() - time_start
+    metrics_add("translate", time_translate)
+
+    po_save(po_dst, po_file_dst)
+    po_journal_close(journal)
+    job_close(job_file)
+
+    if incremental and fingerprint is not None:
+        pending = set()
+        for entry in po_dst:
+            if entry.obsolete or not entry.msgid:
+                continue
+            if (entry.msgid_plural and not po_plural_translated(entry, nplurals)) or (not entry.msgid_plural and entry.msgstr == ""):
+                pending.add(job_key(entry))
+        try:
+            po_fingerprint_save(po_file_dst, fingerprint, pending)
+        except Exception as e:
+            log(str(e), LOG_ERROR)
+
+    return {
+        "file": po_file_dst,
+        "lng_dst": lng_dst,
+        "count": count,
+        "skipped": count_skipped,
+        "forced": count_forced,
+        "translated_cache": count_translated_cache,
+        "translated_memory": count_translated_memory,
+        "translated_online": count_translated_online,
+        "translated_duplicate": count_translated_duplicate,
+        "error": count_error,
+        "retries": count_retries,
+        "chars": count_chars,
+        "time": time_translate,
+        "percent_translated": po_dst.percent_translated(),
+        "untranslated": len(po_dst.untranslated_entries()),
+        "fuzzy": len(po_dst.fuzzy_entries()),
+        "obsolete": len(po_dst.obsolete_entries()),
+    }
+
+
 #### Setup #####
-def setup(path=None, file=None, lng_src=None, lng_dst=None, translator=None, translator_key=None, cache=False, cache_read=False, cache_write=False, force=False, wait=0, autosave=50, loglevel=None, fuzzy=False, fuzzy_enable=False, fuzzy_disable=False, msgid_force=None, msgid_force_original=None, replace_both=None, replace_src=None, replace_dst=None):
+def setup(path=None, file=None, recursive=False, lng_src=None, lng_dst=None, translator=None, translator_key=None, cache=False, cache_read=False, cache_write=False, cache_backend="sqlite", force=False, incremental=False, resume=False, dry_run=False, wait=0, retries=3, autosave=50, loglevel=None, fuzzy=False, fuzzy_enable=False, fuzzy_disable=False, msgid_force=None, msgid_force_original=None, replace_both=None, replace_src=None, replace_dst=None, glossary=None, mask=True, translation_memory=0, workers=0, processes=False, batch_size=1, parallel=0, metrics=None, metrics_format="json", logfile=None, log_queue=False, cache_handle=None, limiter=None, file_root=None):
     global LOG_LEVEL
+    global LOG_FILE
 
     config = __config__
 
     if loglevel is not None:
         LOG_LEVEL = loglevel
 
+    if logfile:
+        LOG_FILE = logfile
+
+    if log_queue:
+        log_queue_start()
+
     log("...............................................................................", LOG_INFO)
     log("        Name: " + __title__ + " - " + __description__, LOG_INFO)
     log("Program File: " + __file__, LOG_INFO)
@@ -294,292 +2605,521 @@ def setup(path=None, file=None, lng_src=None, lng_dst=None, translator=None, tra
         log("Missing parameters", LOG_ERROR)
         panic()
 
-    if lng_src == lng_dst:
+    lng_dst = [value.strip() for value in lng_dst.split(",") if value.strip() != ""]
+
+    if lng_src in lng_dst:
         log("Source and target language are the same", LOG_ERROR)
         panic()
 
-    if path.endswith("/"):
-        path = src[:-1]
+    if file and len(lng_dst) > 1:
+        log("Only one target language is possible for a single file", LOG_ERROR)
+        panic()
+
+    if path and path.endswith("/"):
+        path = path[:-1]
 
     if cache:
         cache_read = True
         cache_write = True
 
-    log("           PO-File Path: " + path, LOG_INFO)
+    log("           PO-File Path: " + (path if path else file), LOG_INFO)
     log("             Translator: " + translator, LOG_INFO)
     log("        Source language: " + lng_src, LOG_INFO)
-    log("Destination language(s): " + lng_dst, LOG_INFO)
+    log("Destination language(s): " + ", ".join(lng_dst), LOG_INFO)
 
     if msgid_force:
-        msgid_force = msgid_force.split(',')
+        msgid_force = match_compile(msgid_force.split(','))
     else:
-        msgid_force = []
+        msgid_force = None
 
     if msgid_force_original:
-        msgid_force_original = msgid_force_original.split(',')
+        msgid_force_original = match_compile(msgid_force_original.split(','))
     else:
-        msgid_force_original = []
+        msgid_force_original = None
 
-    if replace_both:
-        parts = replace_both.split(",")
-        replace_src = {}
-        replace_dst = {}
-        for part in parts:
-            if "=" in part:
-                key, value = part.split("=", 1)
-                replace_src[key] = value
-                replace_dst[value] = key
-    else:
-        if replace_src:
-            parts = replace_src.split(",")
-            replace_src = {}
-            for part in parts:
-                if "=" in part:
-                    key, value = part.split("=", 1)
-                    replace_src[key] = value
-        else:
-            replace_src = {}
+    replace_src, replace_dst = setup_replace(replace_both=replace_both, replace_src=replace_src, replace_dst=replace_dst, glossary=glossary)
 
-        if replace_dst:
-            parts = replace_src.split(",")
-            replace_dst = {}
-            for part in parts:
-                if "=" in part:
-                    key, value = part.split("=", 1)
-                    replace_dst[key] = value
-        else:
-            replace_dst = {}
+    metrics_reset()
 
-    setup_translate(lng_src=lng_src, lng_dst=lng_dst, translator=translator, translator_key=translator_key)
+    with metrics_phase("setup_translate"):
+        for lng in lng_dst:
+            setup_translate(lng_src=lng_src, lng_dst=lng, translator=translator, translator_key=translator_key)
 
-    if cache_read or cache_write:
-        cache = {}
-        if cache_write and not os.path.exists(PATH):
-            os.makedirs(PATH)
-        if os.path.isfile(PATH+"/cache.data"):
-            try:
-                fh = open(PATH+"/cache.data", "rb")
-                cache = umsgpack.unpackb(fh.read())
-                fh.close()
-            except Exception as e:
-                cache = {}
-        if not translator in cache:
-            cache[translator] = {}
-        if not lng_src+"_"+lng_dst in cache[translator]:
-            cache[translator][lng_src+"_"+lng_dst] = {}
+    if not workers:
+        if translator in TRANSLATORS_LOCAL:
+            workers = os.cpu_count() or 1
+        else:
+            workers = 1
 
-    log("", LOG_INFO)
-    log("Translating '" + lng_src + "' to '" + lng_dst + "'. Please wait...", LOG_INFO)
-    log("", LOG_INFO)
+    if not limiter:
+        limiter = rate_limiter(wait)
+
+    if cache_handle:
+        cache = cache_handle
+    elif cache_read or cache_write:
+        try:
+            with metrics_phase("cache_load"):
+                cache = cache_open(backend=cache_backend, create=cache_write and not dry_run)
+        except Exception as e:
+            log(str(e), LOG_ERROR)
+            panic()
 
+    tasks = []
     if file:
-        po_dict = {}
+        if not setup_path_allowed(file, file_root):
+            raise PermissionError("'"+file+"' is not below --file_root")
         if not os.path.isfile(file):
             log("File '"+file+"' not found", LOG_ERROR)
             panic()
-        po_file_dst = file
+        fingerprint = po_fingerprint(po_load(file), source=False) if incremental else None
+        tasks.append({"po_file_src": None, "po_file_dst": file, "po_dict": {}, "po_src": None, "fingerprint": fingerprint, "lng_dst": lng_dst[0]})
     else:
-        po_file_src, po_file_dst = setup_file(path=path, lng_src=lng_src, lng_dst=lng_dst, force=force)
+        if recursive:
+            names = setup_files(path, lng_src)
+            log("Found "+str(len(names))+" .po files", LOG_INFO)
+        else:
+            names = ["LC_MESSAGES/base.po"]
+
+        for name in names:
+            for lng in lng_dst:
+                po_file_src, po_file_dst = setup_file(path=path, lng_src=lng_src, lng_dst=lng, name=name, force=force, resume=resume, dry_run=dry_run, file_root=file_root)
+                tasks.append({"po_file_src": po_file_src, "po_file_dst": po_file_dst, "po_dict": None, "lng_dst": lng})
+
+            po_dict = {}
+            po_src = po_load(po_file_src)
+            for entry in po_src:
+                po_dict[job_key(entry)] = entry.msgstr_plural if entry.msgid_plural else entry.msgstr
+            fingerprint = po_fingerprint(po_src) if incremental else None
+            for task in tasks[-len(lng_dst):]:
+                task["po_dict"] = po_dict
+                task["po_src"] = po_src
+                task["fingerprint"] = fingerprint
+
+        # Start with the largest files so that they do not delay the end of the run
+        tasks.sort(key=lambda task: os.path.getsize(task["po_file_src"]), reverse=True)
 
-        po_dict = {}
-        po_src = polib.pofile(po_file_src)
-        for entry in po_src:
-            po_dict[entry.msgid] = entry.msgstr
+    log("", LOG_INFO)
 
-    po_dst = polib.pofile(po_file_dst)
+    options = {
+        "incremental": incremental,
+        "resume": resume,
+        "dry_run": dry_run,
+        "cache": cache,
+        "cache_read": cache_read,
+        "cache_write": cache_write,
+        "autosave": autosave,
+        "fuzzy": fuzzy,
+        "fuzzy_enable": fuzzy_enable,
+        "fuzzy_disable": fuzzy_disable,
+        "msgid_force": msgid_force,
+        "msgid_force_original": msgid_force_original,
+        "replace_src": replace_src,
+        "replace_dst": replace_dst,
+        "mask": mask,
+        "translation_memory": translation_memory,
+        "workers": workers,
+        "batch_size": batch_size,
+        "limiter": limiter,
+        "retries": retries,
+    }
+
+    if processes and not dry_run:
+        # Every worker process loads the translator (model) once and translates chunks of --batch_size strings.
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=translate_process_init, initargs=(translator, translator_key, lng_src, lng_dst, LOG_LEVEL))
+    else:
+        pool = None
+    options["pool"] = pool
 
-    current_datetime = datetime.now()
-    po_dst.lang = lng_dst
-    po_dst.metadata['Language'] = lng_dst
-    po_dst.metadata['POT-Creation-Date'] = current_datetime.strftime('%Y-%m-%d %H:%M%z')
-    po_dst.metadata['PO-Revision-Date'] = current_datetime.strftime('%Y-%m-%d %H:%M%z')
-    po_dst.save()
+    # Texts which occur in several files are only translated once per language
+    options["shared"] = {lng: translate_shared() for lng in lng_dst}
 
-    count = len(po_dst)
-    count_current = 0
-    count_skipped = 0
-    count_forced = 0
-    count_translated_cache = 0
-    count_translated_online = 0
-    count_error = 0
-    count_chars = 0
+    results = []
+    with ThreadPoolExecutor(max_workers=max(parallel, 1) if parallel else len(lng_dst)) as executor:
+        futures = [executor.submit(setup_language, translator=translator, lng_src=lng_src, **task, **options) for task in tasks]
+        for task, future in zip(tasks, futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                log(task["lng_dst"] + ": " + str(e), LOG_ERROR)
+    results.sort(key=lambda result: (result["file"], result["lng_dst"]))
+    METRICS["results"] = results
+
+    if pool:
+        pool.shutdown(wait=True)
+
+    if cache_handle:
+        if cache_write and not dry_run:
+            cache_save(cache)
+    elif cache_read or cache_write:
+        cache_close(cache)
+
+    for result in results:
+        if dry_run:
+            log("...............................................................................", LOG_NOTICE)
+            log("          Translator: " + translator, LOG_NOTICE)
+            log("         Translation: " + lng_src + " -> " + result["lng_dst"], LOG_NOTICE)
+            if recursive:
+                log("                File: " + result["file"], LOG_NOTICE)
+            log("               Count: " + str(result["count"]), LOG_NOTICE)
+            log("             Skipped: " + str(result["skipped"]), LOG_NOTICE)
+            log("              Forced: " + str(result["forced"]), LOG_NOTICE)
+            log("        To translate: " + str(result["translate"]), LOG_NOTICE)
+            log("               Cache: " + str(result["translated_cache"]), LOG_NOTICE)
+            if translation_memory:
+                log("              Memory: " + str(result["translated_memory"]), LOG_NOTICE)
+            log("          Duplicates: " + str(result["translated_duplicate"]), LOG_NOTICE)
+            log("              Online: " + str(result["translated_online"]), LOG_NOTICE)
+            log("            Requests: " + str(result["requests"]), LOG_NOTICE)
+            log("               Chars: " + str(result["chars"]), LOG_NOTICE)
+            continue
+        log("...............................................................................", LOG_NOTICE)
+        log("          Translator: " + translator, LOG_NOTICE)
+        log("         Translation: " + lng_src + " -> " + result["lng_dst"], LOG_NOTICE)
+        if recursive:
+            log("                File: " + result["file"], LOG_NOTICE)
+        log("               Count: " + str(result["count"]), LOG_NOTICE)
+        log("             Skipped: " + str(result["skipped"]), LOG_NOTICE)
+        log("              Forced: " + str(result["forced"]), LOG_NOTICE)
+        if cache_read:
+            log("    Translated Cache: " + str(result["translated_cache"]), LOG_NOTICE)
+            log("   Translated Online: " + str(result["translated_online"]), LOG_NOTICE)
+        else:
+            log("          Translated: " + str(result["translated_online"]), LOG_NOTICE)
+        if translation_memory:
+            log("   Translated Memory: " + str(result["translated_memory"]), LOG_NOTICE)
+        log("Translated Duplicate: " + str(result["translated_duplicate"]), LOG_NOTICE)
+        log("              Errors: " + str(result["error"]), LOG_NOTICE)
+        log("             Retries: " + str(result["retries"]), LOG_NOTICE)
+        log("    Translated chars: " + str(result["chars"]), LOG_NOTICE)
+        log("            Duration: " + str(round(result["time"], 1)) + "s", LOG_NOTICE)
+        log("  PO-File translated: " + str(result["percent_translated"])+"%", LOG_NOTICE)
+        log("PO-File untranslated: " + str(result["untranslated"]), LOG_NOTICE)
+        log("       PO-File fuzzy: " + str(result["fuzzy"]), LOG_NOTICE)
+        log("    PO-File obsolete: " + str(result["obsolete"]), LOG_NOTICE)
+    log("...............................................................................", LOG_NOTICE)
 
-    i = 0
-    for entry in po_dst:
+    if metrics:
         try:
-            count_current += 1
-
-            if not entry.msgid:
-                count_skipped += 1
-                continue
-
-            for value in msgid_force:
-                if value in entry.msgid:
-                    entry.msgstr = ""
-                    if fuzzy:
-                        entry.fuzzy = False
-                    break
-
-            forced = False
-            for value in msgid_force_original:
-                if value in entry.msgid:
-                    if entry.msgid in po_dict and po_dict[entry.msgid] != "":
-                        entry.msgstr = po_dict[entry.msgid]
-                        if fuzzy:
-                            entry.fuzzy = False
-                    else:
-                        entry.msgstr = entry.msgid
-                        if fuzzy:
-                            entry.fuzzy = False
-                    count_forced += 1
-                    forced = True
-                    break
-            if forced:
-                continue
+            metrics_export(metrics, format=metrics_format)
+        except Exception as e:
+            log(str(e), LOG_ERROR)
 
-            if entry.msgstr != "":
-                count_skipped += 1
-                continue
+    log_queue_stop()
+    log_flush()
 
-            if entry.msgid in po_dict:
-                if entry.msgid == po_dict[entry.msgid]:
-                    count_skipped += 1
-                    continue
-                if po_dict[entry.msgid] != "":
-                    text_src = po_dict[entry.msgid]
-                else:
-                    text_src = entry.msgid
-            else:
-                if entry.msgid == entry.msgstr:
-                    count_skipped += 1
-                    continue
-                text_src = entry.msgid
 
-            text_src_replaced = text_src
-            for key, value in replace_src.items():
-                text_src_replaced = text_src_replaced.replace(key, value)
+#### Cache command ####
+def main_cache(argv):
+    global LOG_LEVEL
 
-            cached = False
-            if cache_read:
-                if text_src_replaced in cache[translator][lng_src+"_"+lng_dst]:
-                    text_dst = cache[translator][lng_src+"_"+lng_dst][text_src_replaced]
-                    cached = True
+    parser = argparse.ArgumentParser(prog="potranslator cache", description=__title__ + " - Maintenance of the translation cache")
+    parser.add_argument("action", choices=["stats", "prune", "export", "import", "merge"], help="stats: entries/size/hit rate per translator and language pair, prune: remove old/least recently used entries, export: write the entries to a file, import/merge: add the entries of other caches (cache.db, cache folder, exported/old cache.data files)")
+    parser.add_argument("files", nargs="*", help="Export: target file, import/merge: source files")
+    parser.add_argument("-cb", "--cache_backend", action="store", type=str, default="sqlite", choices=CACHE_BACKENDS, help="Storage backend of the translation cache")
+    parser.add_argument("-t", "--translator", action="store", type=str, default=None, help="Only entries of this translator (prune/export)")
+    parser.add_argument("-lp", "--lng_pair", action="store", type=str, default=None, help="Only entries of this language pair, e.g. en_de (prune/export)")
+    parser.add_argument("--age", action="store", type=float, default=None, help="Prune: remove entries which were not used for this number of days")
+    parser.add_argument("--max_entries", action="store", type=int, default=None, help="Prune: keep at most this number of entries (least recently used are removed)")
+    parser.add_argument("--format", action="store", type=str, default="msgpack", choices=["msgpack", "json"], help="Export: file format")
+    parser.add_argument("-l", "--loglevel", action="store", type=int, default=LOG_LEVEL, help="Log level")
+    params = parser.parse_args(argv)
+
+    LOG_LEVEL = params.loglevel
+
+    if params.action in ["export", "import", "merge"] and not params.files:
+        log("Missing file(s)", LOG_ERROR)
+        panic()
+    if params.action == "export" and len(params.files) != 1:
+        log("Only one target file is possible", LOG_ERROR)
+        panic()
+    if params.action == "prune" and params.age is None and params.max_entries is None:
+        log("Missing --age or --max_entries", LOG_ERROR)
+        panic()
 
-            if not cached:
-                if wait:
-                    time.sleep(wait/1000.0)
-                text_dst = translate(text_src_replaced, lng_src, lng_dst, translator)
+    try:
+        cache = cache_open(backend=params.cache_backend, create=params.action in ["prune", "import", "merge"])
+    except Exception as e:
+        log(str(e), LOG_ERROR)
+        panic()
 
-            if text_dst != "":
-                for key, value in replace_dst.items():
-                    text_dst = text_dst.replace(key, value)
+    try:
+        if params.action == "stats":
+            stats = cache_stats(cache)
+            line = "{:<20} {:<10} {:>10} {:>12} {:>10} {:>9}"
+            print(line.format("Translator", "Language", "Entries", "Size [kB]", "Lookups", "Hit rate"))
+            total = {"entries": 0, "bytes": 0, "lookups": 0, "hits": 0}
+            for (translator, lng), value in sorted(stats.items()):
+                for key in total:
+                    total[key] += value[key]
+                rate = str(round(value["hits"] * 100.0 / value["lookups"], 1)) + "%" if value["lookups"] else "-"
+                print(line.format(translator, lng, value["entries"], round(value["bytes"] / 1024.0, 1), value["lookups"], rate))
+            rate = str(round(total["hits"] * 100.0 / total["lookups"], 1)) + "%" if total["lookups"] else "-"
+            print(line.format("Total", "", total["entries"], round(total["bytes"] / 1024.0, 1), total["lookups"], rate))
+
+        elif params.action == "prune":
+            count = cache_prune(cache, age=params.age, max_entries=params.max_entries, translator=params.translator, lng=params.lng_pair)
+            log("Removed "+str(count)+" cache entries", LOG_NOTICE)
+
+        elif params.action == "export":
+            count = cache_export(cache, params.files[0], format=params.format, translator=params.translator, lng=params.lng_pair)
+            log("Exported "+str(count)+" cache entries to '"+params.files[0]+"'", LOG_NOTICE)
 
-                if not cached and cache_write:
-                    cache[translator][lng_src+"_"+lng_dst][text_src] = text_dst
+        else:
+            for file in params.files:
+                cache_import(cache, file)
 
-                if text_src.startswith(('.', ',', ':', ';', '-', '_', '?', '!')):
-                    text_src_char0 = text_src[0]
-                else:
-                    text_src_char0 = None
-                if text_src.endswith(('.', ',', ':', ';', '-', '_', '?', '!')):
-                    text_src_char1 = text_src[-1]
-                else:
-                    text_src_char1 = None
-                if text_dst.startswith(('.', ',', ':', ';', '-', '_', '?', '!')):
-                    text_dst_char0 = text_dst[0]
-                else:
-                    text_dst_char0 = None
-                if text_dst.endswith(('.', ',', ':', ';', '-', '_', '?', '!')):
-                    text_dst_char1 = text_dst[-1]
-                else:
-                    text_dst_char1 = None
+        cache_close(cache)
+    except Exception as e:
+        log(str(e), LOG_ERROR)
+        panic()
 
-                if text_src_char0 != text_dst_char0:
-                    if text_dst_char0 == None:
-                        text_dst = text_src_char0 + text_dst
-                    elif text_src_char0 == None:
-                        text_dst = text_dst[1:]
-                    else:
-                        text_dst = text_src_char0 + text_dst[1:]
 
-                if text_src_char1 != text_dst_char1:
-                    if text_dst_char1 == None:
-                        text_dst = text_dst + text_src_char1
-                    elif text_src_char1 == None:
-                        text_dst = text_dst[:-1]
-                    else:
-                        text_dst = text_dst[:-1] + text_src_char1
+#### Serve command ####
+def main_serve(argv):
+    global LOG_LEVEL
+    global LOG_FILE
+
+    parser = argparse.ArgumentParser(prog="potranslator serve", description=__title__ + " - Local translation service (HTTP or Unix socket), the translator and the cache stay loaded between the requests")
+    parser.add_argument("--host", action="store", type=str, default="127.0.0.1", help="Address of the HTTP server")
+    parser.add_argument("--port", action="store", type=int, default=8765, help="Port of the HTTP server")
+    parser.add_argument("--socket", action="store", type=str, default=None, help="Listen on this Unix socket instead of the HTTP port")
+    parser.add_argument("--file_root", action="store", type=str, default=None, help="Only translate .po files below these directories (comma separated), required for /translate_file if --host is not a loopback address")
+    parser.add_argument("-s", "--lng_src", action="store", type=str, default=None, help="Default source language (2 digit locales code)")
+    parser.add_argument("-d", "--lng_dst", action="store", type=str, default=None, help="Default destination language(s), loaded at the start (comma separated)")
+    parser.add_argument("-t", "--translator", action="store", type=str, default=None, help="Translation service provider")
+    parser.add_argument("-tk", "--translator_key", action="store", type=str, default=None, help="API key for the translation service provider")
+    parser.add_argument("-c", "--cache", action="store_true", default=False, help="Use an internal translation cache (read and write)")
+    parser.add_argument("-cr", "--cache_read", action="store_true", default=False, help="Use an internal translation cache (read)")
+    parser.add_argument("-cw", "--cache_write", action="store_true", default=False, help="Use an internal translation cache (write)")
+    parser.add_argument("-cb", "--cache_backend", action="store", type=str, default="sqlite", choices=CACHE_BACKENDS, help="Storage backend of the translation cache")
+    parser.add_argument("-w", "--wait", action="store", type=int, default=0, help="Initial waiting time in milliseconds between translations (adjusted automatically)")
+    parser.add_argument("-r", "--retries", action="store", type=int, default=3, help="Number of retries on temporary errors of the translation service provider")
+    parser.add_argument("-wo", "--workers", action="store", type=int, default=0, help="Number of parallel translations (default: 1, number of CPU cores for local translators)")
+    parser.add_argument("-bs", "--batch_size", action="store", type=int, default=1, help="Number of translations per request (if supported by the translation service provider)")
+    parser.add_argument("-lf", "--logfile", action="store", type=str, default=None, help="Write the log to this file instead of the console")
+    parser.add_argument("-l", "--loglevel", action="store", type=int, default=LOG_LEVEL, help="Log level")
+    parser.add_argument("--replace_both", action="store", type=str, default=None, help="Replace source and destination string with other string: search=replace,search=replace,...")
+    parser.add_argument("--replace_src", action="store", type=str, default=None, help="Replace source string with other string: search=replace,search=replace,...")
+    parser.add_argument("--replace_dst", action="store", type=str, default=None, help="Replace destination string with other string: search=replace,search=replace,...")
+    parser.add_argument("--mask_disable", action="store_true", default=False, help="Do not replace placeholders (%%s, {name}, ...) and markup with tokens before the translation")
+    parser.add_argument("--glossary", action="store", type=str, default=None, help="File with replacement rules (one search=replace per line, sections [both], [src], [dst])")
+    params = parser.parse_args(argv)
+
+    LOG_LEVEL = params.loglevel
+    if params.logfile:
+        LOG_FILE = params.logfile
+
+    if params.translator == None:
+        log("Missing parameters", LOG_ERROR)
+        panic()
 
-                entry.msgstr = text_dst
+    lng_dst = [value.strip() for value in (params.lng_dst or "").split(",") if value.strip() != ""]
 
-                if fuzzy:
-                    if fuzzy_enable:
-                        entry.fuzzy = True
-                    elif fuzzy_disable:
-                        entry.fuzzy = False
+    workers = params.workers
+    if not workers:
+        if params.translator in TRANSLATORS_LOCAL:
+            workers = os.cpu_count() or 1
+        else:
+            workers = 1
 
-                i += 1
-                if i >= autosave:
-                    i = 0
-                    po_dst.save()
-                    if cache_write:
-                        try:
-                            fh = open(PATH+"/cache.data", "wb")
-                            fh.write(umsgpack.packb(cache))
-                            fh.close()
-                        except Exception as e:
-                            log(str(e), LOG_ERROR)
-
-                if cached:
-                    count_translated_cache += 1
-                    log(str(count_current)+"/"+str(count)+": "+text_src+" -> "+text_dst+" [CACHE]", LOG_INFO)
-                else:
-                    count_translated_online += 1
-                    count_chars += len(text_src)
-                    log(str(count_current)+"/"+str(count)+": "+text_src+" -> "+text_dst+" [ONLINE]", LOG_INFO)
+    replace_src, replace_dst = setup_replace(replace_both=params.replace_both, replace_src=params.replace_src, replace_dst=params.replace_dst, glossary=params.glossary)
 
+    # The files of /translate_file are read and written with the rights of the server process: Without --file_root only for local clients.
+    if params.file_root:
+        file_root = [os.path.realpath(value.strip()) for value in params.file_root.split(",") if value.strip() != ""]
+    elif params.socket or serve_loopback(params.host):
+        file_root = []
+    else:
+        file_root = None
+        log("/translate_file is disabled, the server is reachable from other hosts and --file_root is not set", LOG_WARNING)
+
+    SERVE.clear()
+    SERVE.update({
+        "translator": params.translator,
+        "translator_key": params.translator_key,
+        "lng_src": params.lng_src,
+        "lng_dst": lng_dst,
+        "cache": None,
+        "cache_backend": params.cache_backend,
+        "cache_read": params.cache or params.cache_read,
+        "cache_write": params.cache or params.cache_write,
+        "limiter": rate_limiter(params.wait),
+        "retries": params.retries,
+        "workers": workers,
+        "batch_size": params.batch_size,
+        "mask": not params.mask_disable,
+        "replace_both": params.replace_both,
+        "replace_src_text": params.replace_src,
+        "replace_dst_text": params.replace_dst,
+        "glossary": params.glossary,
+        "file_root": file_root,
+        "replace_src": replace_src,
+        "replace_dst": replace_dst,
+        "time_start": time.time(),
+        "requests": 0,
+        "texts": 0,
+    })
+
+    # Load the translator (models) of the default languages at the start instead of on the first request
+    if params.lng_src:
+        for lng in lng_dst:
+            setup_translate(lng_src=params.lng_src, lng_dst=lng, translator=params.translator, translator_key=params.translator_key)
+
+    if SERVE["cache_read"] or SERVE["cache_write"]:
+        try:
+            SERVE["cache"] = cache_open(backend=params.cache_backend, create=SERVE["cache_write"])
         except Exception as e:
-            count_error += 1
             log(str(e), LOG_ERROR)
+            panic()
+
+    try:
+        server = serve_server(host=params.host, port=params.port, socket_file=params.socket)
+    except Exception as e:
+        log(str(e), LOG_ERROR)
+        panic()
+    if params.socket:
+        log("Listening on Unix socket " + params.socket, LOG_NOTICE)
+    else:
+        log("Listening on http://" + params.host + ":" + str(server.server_address[1]), LOG_NOTICE)
 
-    po_dst.save()
+    # Stop with SIGTERM (service managers) like with CTRL-C, the cache is saved in both cases
+    signal.signal(signal.SIGTERM, lambda signum, frame: exit())
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        log("Terminated by CTRL-C", LOG_NOTICE)
+    finally:
+        server.server_close()
+        if params.socket:
+            serve_socket_remove(params.socket)
+        if SERVE["cache"]:
+            cache_close(SERVE["cache"])
+        log_flush()
+
+
+#### Stream command ####
+def main_stream(argv):
+    global LOG_LEVEL
+    global LOG_FILE
+    global LOG_CONSOLE
+
+    parser = argparse.ArgumentParser(prog="potranslator stream", description=__title__ + " - Translate a .po file or text segments from stdin to stdout (in windows of a fixed size, e.g. between msgmerge/msgcat)")
+    parser.add_argument("-fm", "--format", action="store", type=str, default="po", choices=STREAM_FORMATS, help="Input format: po (.po file), lines (one text per line), jsonl (one JSON string or object with 'text' per line)")
+    parser.add_argument("-ws", "--window", action="store", type=int, default=100, help="Number of entries/lines which are translated and written together")
+    parser.add_argument("-s", "--lng_src", action="store", type=str, default=None, help="Source language (2 digit locales code)")
+    parser.add_argument("-d", "--lng_dst", action="store", type=str, default=None, help="Destination language (2 digit locales code)")
+    parser.add_argument("-t", "--translator", action="store", type=str, default=None, help="Translation service provider")
+    parser.add_argument("-tk", "--translator_key", action="store", type=str, default=None, help="API key for the translation service provider")
+    parser.add_argument("-c", "--cache", action="store_true", default=False, help="Use an internal translation cache (read and write)")
+    parser.add_argument("-cr", "--cache_read", action="store_true", default=False, help="Use an internal translation cache (read)")
+    parser.add_argument("-cw", "--cache_write", action="store_true", default=False, help="Use an internal translation cache (write)")
+    parser.add_argument("-cb", "--cache_backend", action="store", type=str, default="sqlite", choices=CACHE_BACKENDS, help="Storage backend of the translation cache")
+    parser.add_argument("-fo", "--force", action="store_true", default=False, help="Forcing a new translation of already translated .po entries")
+    parser.add_argument("-w", "--wait", action="store", type=int, default=0, help="Initial waiting time in milliseconds between translations (adjusted automatically)")
+    parser.add_argument("-r", "--retries", action="store", type=int, default=3, help="Number of retries on temporary errors of the translation service provider")
+    parser.add_argument("-wo", "--workers", action="store", type=int, default=0, help="Number of parallel translations (default: 1, number of CPU cores for local translators)")
+    parser.add_argument("-bs", "--batch_size", action="store", type=int, default=1, help="Number of translations per request (if supported by the translation service provider)")
+    parser.add_argument("-lf", "--logfile", action="store", type=str, default=None, help="Write the log to this file instead of stderr")
+    parser.add_argument("-l", "--loglevel", action="store", type=int, default=LOG_WARNING, help="Log level")
+    parser.add_argument("--replace_both", action="store", type=str, default=None, help="Replace source and destination string with other string: search=replace,search=replace,...")
+    parser.add_argument("--replace_src", action="store", type=str, default=None, help="Replace source string with other string: search=replace,search=replace,...")
+    parser.add_argument("--replace_dst", action="store", type=str, default=None, help="Replace destination string with other string: search=replace,search=replace,...")
+    parser.add_argument("--mask_disable", action="store_true", default=False, help="Do not replace placeholders (%%s, {name}, ...) and markup with tokens before the translation")
+    parser.add_argument("--glossary", action="store", type=str, default=None, help="File with replacement rules (one search=replace per line, sections [both], [src], [dst])")
+    params = parser.parse_args(argv)
+
+    # stdout is used for the translations
+    LOG_CONSOLE = sys.stderr
+    LOG_LEVEL = params.loglevel
+    if params.logfile:
+        LOG_FILE = params.logfile
+
+    if params.lng_src == None or params.lng_dst == None or params.translator == None:
+        log("Missing parameters", LOG_ERROR)
+        panic()
+
+    if params.window < 1:
+        log("The window size must be at least 1", LOG_ERROR)
+        panic()
 
-    if cache_write:
+    workers = params.workers
+    if not workers:
+        if params.translator in TRANSLATORS_LOCAL:
+            workers = os.cpu_count() or 1
+        else:
+            workers = 1
+
+    replace_src, replace_dst = setup_replace(replace_both=params.replace_both, replace_src=params.replace_src, replace_dst=params.replace_dst, glossary=params.glossary)
+
+    setup_translate(lng_src=params.lng_src, lng_dst=params.lng_dst, translator=params.translator, translator_key=params.translator_key)
+
+    options = {
+        "translator": params.translator,
+        "cache": None,
+        "cache_read": params.cache or params.cache_read,
+        "cache_write": params.cache or params.cache_write,
+        "replace_src": replace_src,
+        "replace_dst": replace_dst,
+        "mask": not params.mask_disable,
+        "workers": workers,
+        "batch_size": params.batch_size,
+        "limiter": rate_limiter(params.wait),
+        "retries": params.retries,
+    }
+
+    if options["cache_read"] or options["cache_write"]:
         try:
-            fh = open(PATH+"/cache.data", "wb")
-            fh.write(umsgpack.packb(cache))
-            fh.close()
+            options["cache"] = cache_open(backend=params.cache_backend, create=options["cache_write"])
         except Exception as e:
             log(str(e), LOG_ERROR)
+            panic()
 
-    log("...............................................................................", LOG_NOTICE)
-    log("          Translator: " + translator, LOG_NOTICE)
-    log("         Translation: " + lng_src + " -> " + lng_dst, LOG_NOTICE)
-    log("               Count: " + str(count), LOG_NOTICE)
-    log("             Skipped: " + str(count_skipped), LOG_NOTICE)
-    log("              Forced: " + str(count_forced), LOG_NOTICE)
-    if cache_read:
-        log("    Translated Cache: " + str(count_translated_cache), LOG_NOTICE)
-        log("   Translated Online: " + str(count_translated_online), LOG_NOTICE)
-    else:
-        log("          Translated: " + str(count_translated_online), LOG_NOTICE)
-    log("              Errors: " + str(count_error), LOG_NOTICE)
-    log("    Translated chars: " + str(count_chars), LOG_NOTICE)
-    log("  PO-File translated: " + str(po_dst.percent_translated())+"%", LOG_NOTICE)
-    log("PO-File untranslated: " + str(len(po_dst.untranslated_entries())), LOG_NOTICE)
-    log("       PO-File fuzzy: " + str(len(po_dst.fuzzy_entries())), LOG_NOTICE)
-    log("    PO-File obsolete: " + str(len(po_dst.obsolete_entries())), LOG_NOTICE)
-    log("...............................................................................", LOG_NOTICE)
+    sys.stdin.reconfigure(encoding="utf-8")
+    sys.stdout.reconfigure(encoding="utf-8")
+
+    try:
+        if params.format == "po":
+            stats = stream_po(sys.stdin, sys.stdout, params.lng_src, params.lng_dst, options, window=params.window, force=params.force)
+        else:
+            stats = stream_lines(sys.stdin, sys.stdout, params.lng_src, params.lng_dst, options, window=params.window, jsonl=params.format == "jsonl")
+    except BrokenPipeError:
+        # The reading side of the pipe was closed (e.g. head), the remaining output is discarded
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        stats = None
+    finally:
+        if options["cache"]:
+            cache_close(options["cache"])
+
+    if stats:
+        log("Stream: " + str(stats["count"]) + " entries, " + str(stats["translated"]) + " texts translated, " + str(stats["error"]) + " errors", LOG_NOTICE)
+    log_flush()
+
+    if stats and stats["error"]:
+        panic()
 
 
 #### Start ####
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "cache":
+        main_cache(sys.argv[2:])
+        return
+
+    if len(sys.argv) > 1 and sys.argv[1] == "serve":
+        main_serve(sys.argv[2:])
+        return
+
+    if len(sys.argv) > 1 and sys.argv[1] == "stream":
+        main_stream(sys.argv[2:])
+        return
+
     try:
         description = __title__ + " - " + __description__
         parser = argparse.ArgumentParser(description=description)
 
         parser.add_argument("-p", "--path", action="store", type=str, default=None, help="Option 1: Path to locales directory (source and target language folders are in this folder)")
         parser.add_argument("-f", "--file", action="store", type=str, default=None, help="Option 2: .po file (direct editing of the file)")
+        parser.add_argument("-rc", "--recursive", action="store_true", default=False, help="Translate all .po files in the source language folder (instead of LC_MESSAGES/base.po)")
 
         parser.add_argument("-s", "--lng_src", action="store", type=str, default=None, help="Source language (2 digit locales code)")
         parser.add_argument("-d", "--lng_dst", action="store", type=str, default=None, help="Destination language (2 digit locales code) (comma separated)")
@@ -590,10 +3130,23 @@ def main():
         parser.add_argument("-c", "--cache", action="store_true", default=False, help="Use an internal translation cache (read and write)")
         parser.add_argument("-cr", "--cache_read", action="store_true", default=False, help="Use an internal translation cache (read)")
         parser.add_argument("-cw", "--cache_write", action="store_true", default=False, help="Use an internal translation cache (write)")
+        parser.add_argument("-cb", "--cache_backend", action="store", type=str, default="sqlite", choices=CACHE_BACKENDS, help="Storage backend of the translation cache")
 
         parser.add_argument("-fo", "--force", action="store_true", default=False, help="Forcing a new translation")
-        parser.add_argument("-w", "--wait", action="store", type=int, default=0, help="Waiting time in milliseconds between translations")
-        parser.add_argument("-a", "--autosave", action="store", type=int, default=50, help="Automatic saving after x-translations")
+        parser.add_argument("-in", "--incremental", action="store_true", default=False, help="Only translate the entries which were added/changed in the source file since the last run (also updates outdated translations)")
+        parser.add_argument("-re", "--resume", action="store_true", default=False, help="Resume an interrupted run (skip the already translated entries)")
+        parser.add_argument("-dr", "--dry_run", action="store_true", default=False, help="Only show the planned translations (count, requests, chars) without translating")
+        parser.add_argument("-w", "--wait", action="store", type=int, default=0, help="Initial waiting time in milliseconds between translations (adjusted automatically)")
+        parser.add_argument("-r", "--retries", action="store", type=int, default=3, help="Number of retries on temporary errors of the translation service provider")
+        parser.add_argument("-wo", "--workers", action="store", type=int, default=0, help="Number of parallel translations (default: 1, number of CPU cores for local translators)")
+        parser.add_argument("-pr", "--processes", action="store_true", default=False, help="Use worker processes instead of threads for the parallel translations (for local translators)")
+        parser.add_argument("-pa", "--parallel", action="store", type=int, default=0, help="Number of files/languages translated at the same time (default: number of languages)")
+        parser.add_argument("-bs", "--batch_size", action="store", type=int, default=1, help="Number of translations per request (if supported by the translation service provider)")
+        parser.add_argument("-a", "--autosave", action="store", type=int, default=50, help="Automatic saving after x-translations (cache), the .po file is rewritten after x-translations or 10%% of the entries (the larger value), all translations are kept in a journal in between")
+        parser.add_argument("-m", "--metrics", action="store", type=str, default=None, help="Export the metrics (timings, latencies, counts) of the run to this file")
+        parser.add_argument("-mf", "--metrics_format", action="store", type=str, default="json", choices=["json", "prometheus"], help="Format of the metrics file")
+        parser.add_argument("-lf", "--logfile", action="store", type=str, default=None, help="Write the log to this file instead of the console")
+        parser.add_argument("-lq", "--log_queue", action="store_true", default=False, help="Write the log in a background thread")
         parser.add_argument("-l", "--loglevel", action="store", type=int, default=LOG_LEVEL, help="Log level")
 
         parser.add_argument("--fuzzy", action="store_true", default=False, help="Change/Set the 'fuzzy' flag")
@@ -605,10 +3158,13 @@ def main():
         parser.add_argument("--replace_both", action="store", type=str, default=None, help="Replace source and destination string with other string: search=replace,search=replace,...")
         parser.add_argument("--replace_src", action="store", type=str, default=None, help="Replace source string with other string: search=replace,search=replace,...")
         parser.add_argument("--replace_dst", action="store", type=str, default=None, help="Replace destination string with other string: search=replace,search=replace,...")
+        parser.add_argument("--mask_disable", action="store_true", default=False, help="Do not replace placeholders (%%s, {name}, ...) and markup with tokens before the translation")
+        parser.add_argument("-tm", "--translation_memory", action="store", type=float, default=0, help="Use translations of similar texts (cache, already translated entries) with a similarity >= this value (0-1, e.g. 0.85), marked as fuzzy")
+        parser.add_argument("--glossary", action="store", type=str, default=None, help="File with replacement rules (one search=replace per line, sections [both], [src], [dst])")
 
         params = parser.parse_args()
 
-        setup(path=params.path, file=params.file, lng_src=params.lng_src, lng_dst=params.lng_dst, translator=params.translator, translator_key=params.translator_key, cache=params.cache, cache_read=params.cache_read, cache_write=params.cache_write, force=params.force, wait=params.wait, autosave=params.autosave, loglevel=params.loglevel, fuzzy=params.fuzzy, fuzzy_enable=params.fuzzy_enable, fuzzy_disable=params.fuzzy_disable, msgid_force=params.msgid_force, msgid_force_original=params.msgid_force_original, replace_both=params.replace_both, replace_src=params.replace_src, replace_dst=params.replace_dst)
+        setup(path=params.path, file=params.file, recursive=params.recursive, lng_src=params.lng_src, lng_dst=params.lng_dst, translator=params.translator, translator_key=params.translator_key, cache=params.cache, cache_read=params.cache_read, cache_write=params.cache_write, cache_backend=params.cache_backend, force=params.force, incremental=params.incremental, resume=params.resume, dry_run=params.dry_run, wait=params.wait, retries=params.retries, autosave=params.autosave, loglevel=params.loglevel, fuzzy=params.fuzzy, fuzzy_enable=params.fuzzy_enable, fuzzy_disable=params.fuzzy_disable, msgid_force=params.msgid_force, msgid_force_original=params.msgid_force_original, replace_both=params.replace_both, replace_src=params.replace_src, replace_dst=params.replace_dst, glossary=params.glossary, mask=not params.mask_disable, translation_memory=params.translation_memory, workers=params.workers, processes=params.processes, batch_size=params.batch_size, parallel=params.parallel, metrics=params.metrics, metrics_format=params.metrics_format, logfile=params.logfile, log_queue=params.log_queue)
 
     except KeyboardInterrupt:
         print("Terminated by CTRL-C")
@@ -620,4 +3176,5 @@ def main():
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     main()
\ No newline at end of file